@@ -29,16 +29,27 @@
 # Imports
 import logging
 import threading
+import queue
+import heapq
+import time
 import messaging
 import geniePi
 import thermostat
 from datetime import datetime
-import urllib2
+import urllib.request
+import urllib.error
 import xml.etree.ElementTree as ET
 
 #===============================================================================
 # CONSTANTS
 #===============================================================================
+# Timing
+REPLY_POLL_MIN	= 0.02	# Delay in seconds between reply checks while the display is in use
+REPLY_POLL_MAX	= 0.2	# Longest delay in seconds between reply checks once the display is idle
+WEATHER_PERIOD	= 15*60	# Delay in seconds between weather updates
+WEATHER_TIMEOUT	= 10	# Timeout in seconds for the weather server to respond
+CLOCK_MARGIN	= 0.05	# Seconds past the minute to update the clock, so an early wake still sees the new minute
+
 # Display Addresses
 CLOCK_ADD		= 0x00
 INTEMP_ADD		= 0x01
@@ -69,6 +80,8 @@ INSIDE_TEMP     = 5
 OUTSIDE_TEMP    = 6
 SETPOINT_TEMP   = 7
 POWER_LED       = 8
+CLOCK_TIME      = 9
+WEATHER_ICON    = 10
 
 # Weather Icon Addresses
 WX_SUNNY        =  0
@@ -82,6 +95,20 @@ WX_SCAT_SNOW    =  7
 WX_SNOW         =  8
 WX_FZ_RAIN      =  9
 
+# Weather Icon Selection
+PRECIP_RULES	= (	# (weather code, icon, icon when showers), checked in order of precedence
+	('TS', WX_TSTORM, WX_TSTORM),
+	('FZ', WX_FZ_RAIN, WX_FZ_RAIN),
+	('SN', WX_SNOW, WX_SCAT_SNOW),
+	('RA', WX_RAIN, WX_SHOWERS),
+	('DZ', WX_RAIN, WX_SHOWERS) )
+SKY_COVER_ICONS	= {	# Icon for a cloud layer below 12,000 ft - larger icons indicate more coverage
+	'FEW': WX_FEW_CLOUDS,
+	'SCT': WX_SCT_CLOUDS,
+	'BKN': WX_OVC_CLOUDS,
+	'OVC': WX_OVC_CLOUDS }
+CLEAR_SKY_COVERS = ('SKC', 'CLR')
+
 #===============================================================================
 # DisplayControl Class
 #===============================================================================
@@ -92,6 +119,13 @@ WX_FZ_RAIN      =  9
 #	_kill_event	    :	The event signaling a shutdown of the thread
 #	_display_error  : 	Indicates if there is an error with the display
 #   _setpoint       :   Contains the setpoint in degrees
+#   _display_state  :   The last value written to, or reported by, each (object, address) on the display
+#   _display_text   :   The last string written to each string address on the display
+#   _status_handlers:   Maps SET_STATUS subcommands to the update method and address
+#   _reply_handlers :   Maps the (object, index) of display report events to the handler method
+#   _cmd_q          :   Queue of lists of display commands waiting to be processed by the display thread
+#   _btn_status     :   Thermostat status indexed by whether a button is on
+#   _debug_logging  :   Indicates if debug messages are being logged
 #
 class DisplayControl(threading.Thread):
 	#---------------------------------------------------------------------------
@@ -104,9 +138,34 @@ class DisplayControl(threading.Thread):
 		self._ehandler = event_handler
 		self._display_error = False
 		self._setpoint = 15
+		self._display_state = {}
+		self._display_text = {}
+
+		# Map the SET_STATUS subcommands to the update method and display address
+		self._status_handlers = {
+			PROGRAM_BTN:	(self._update_btn, PROGRAM_BTN_ADD),
+			RELAY_LED:		(self._update_led, RELAY_LED_ADD),
+			OVER_BTN:		(self._update_btn, OVER_BTN_ADD),
+			OVER_SCALE:		(self._update_scale, TRACKBAR_ADD),
+			INSIDE_TEMP:	(self._update_string, INTEMP_ADD),
+			OUTSIDE_TEMP:	(self._update_string, OUTTEMP_ADD),
+			SETPOINT_TEMP:	(self._update_string, SETPOINT_ADD),
+			POWER_LED:		(self._update_led, POWER_LED_ADD),
+			CLOCK_TIME:		(self._update_string, CLOCK_ADD),
+			WEATHER_ICON:	(self._update_icon, WEATHER_ADD) }
+
+		# Map the objects the display reports changes on to their handlers
+		self._reply_handlers = {
+			(geniePi.GENIE_OBJ_4DBUTTON, PROGRAM_BTN_ADD):	self._update_power_status,
+			(geniePi.GENIE_OBJ_4DBUTTON, OVER_BTN_ADD):		self._on_override_btn,
+			(geniePi.GENIE_OBJ_TRACKBAR, TRACKBAR_ADD):		self._on_trackbar }
+
+		self._cmd_q = queue.Queue()
+		self._btn_status = (thermostat.STATUS_OFF, thermostat.STATUS_ON)  # Built here since thermostat imports this module
 
 		# Initialize logger
 		self._logger = logging.getLogger('MAIN.DISPLAY')
+		self._debug_logging = self._logger.isEnabledFor(logging.DEBUG)	# The level is fixed by the config file, so check it once
 
 		# Initialize as a thread
 		self._kill_event = kill_event
@@ -122,91 +181,122 @@ class DisplayControl(threading.Thread):
 			self._display_error = True
 		else:	# Run the thread
 			self._logger.debug('  Connected to the display')
+			self._display_state.clear()  # Nothing is known to be on the display until it is written
+			self._display_text.clear()
 
 			# Create the reply structure
 			reply = geniePi.genieReplyStruct()
 
-			# Start the clock thread
-			clock_thread = ClockController(self._kill_event, self._display_error)
-			clock_thread.start()
-
-			# Start the weather display thread
-			weather_thread = WeatherDisplay(self._kill_event, self._display_error)
-			weather_thread.start()
+			# Start the thread that runs the clock and weather updates - they queue their writes, so only this thread uses the display
+			scheduler_thread = DisplayScheduler(self._kill_event, [ ClockController(self._queue_status), WeatherDisplay(self._queue_status) ])
+			scheduler_thread.start()
 		
+			# Bind the names used on every pass of the loop locally
+			reply_avail = geniePi.genieReplyAvail
+			get_reply = geniePi.genieGetReply
+			REPORT_EVENT = geniePi.GENIE_REPORT_EVENT
+			is_killed = self._kill_event.is_set
+			cmd_get = self._cmd_q.get
+			cmd_get_nowait = self._cmd_q.get_nowait
+			process_command = self._process_command
+			display_state = self._display_state
+			reply_handlers = self._reply_handlers
+
 			# Start infinite loop listening for messages from the display
-			while not self._kill_event.is_set():
+			poll_delay = REPLY_POLL_MIN
+			while not is_killed():
 				# Handle any data coming from the display
-				while geniePi.genieReplyAvail():
-					geniePi.genieGetReply(reply)  # Read next reply for message handling
+				display_active = False
+				while reply_avail():
+					display_active = True
+					get_reply(reply)  # Read next reply for message handling
 					
 					# Handle the message type - only expecting report events
-					if reply.cmd == geniePi.GENIE_REPORT_EVENT:
-						if reply.object == geniePi.GENIE_OBJ_4DBUTTON:  # Button pressed
-							if reply.index == PROGRAM_BTN_ADD:
-								self._update_power_status(reply.data)
-							elif reply.index == OVER_BTN_ADD:
-								# Only allow this to change state if the thermostat power is on
-								thermo_status = geniePi.genieReadObj(geniePi.GENIE_OBJ_4DBUTTON, PROGRAM_BTN_ADD)
-								if thermo_status:
-									self._update_override(reply.data, self._setpoint)
-								else:  # Revert the override status to its initial state
-									prev_override_status = BTN_OFF if reply.data else BTN_ON
-									geniePi.genieWriteObj(geniePi.GENIE_OBJ_4DBUTTON, OVER_BTN_ADD, prev_override_status)
-							else:
-								self._logger.error('  Unknown button pressed: %i.  No action taken', reply.index)
-						elif reply.object == geniePi.GENIE_OBJ_TRACKBAR:  # Slider interacted with
-							if reply.index == TRACKBAR_ADD:
-								# Update the internal setpoint register
-								self._setpoint = 15 + reply.data
-
-								# Update the thermostat controller iff override mode is on
-								override_status = geniePi.genieReadObj(geniePi.GENIE_OBJ_4DBUTTON, OVER_BTN_ADD)
-								self._logger.debug('    Current display override status: %i', override_status)
-								if override_status:  # The override mode is on
-									self._update_override(override_status, self._setpoint)
-							else:
-								self._logger.error('  Unknown trackbar changes: %i.  No action taken', reply.index)
+					if reply.cmd == REPORT_EVENT:
+						display_state[(reply.object, reply.index)] = reply.data  # The display has changed this object itself
+						handler = reply_handlers.get((reply.object, reply.index))
+						if handler:
+							handler(reply.data)
 						else:
-							self._logger.error('  Unknown object changed: %i.  No action taken', reply.object)
+							self._logger.error('  Unknown object changed: %i, index %i.  No action taken', reply.object, reply.index)
 					else:   # Unknown item
 						self._logger.error('  Unknown display message type: %i.  No action taken', reply.cmd)
 
-				# Wait for next message
-				self._kill_event.wait(0.02)	# Check every 20 milliseconds
-
-			# Cleanup the clock thread
-			weather_thread.join()
-			clock_thread.join()
+				# Wait for the next command - geniePi buffers replies on its own listener thread, so back off while idle
+				poll_delay = REPLY_POLL_MIN if display_active else min(2*poll_delay, REPLY_POLL_MAX)
+				try:
+					pending = list(cmd_get(timeout=poll_delay))
+				except queue.Empty:
+					continue
+
+				# Drain everything else that has queued up so it is handled in one pass
+				try:
+					while True:
+						pending.extend(cmd_get_nowait())
+				except queue.Empty:
+					pass
+
+				# Process the commands, keeping only the last of consecutive updates to the same item
+				last = len(pending) - 1
+				for i, cur_cmd in enumerate(pending):
+					if i < last and pending[i+1].command == cur_cmd.command and pending[i+1].subcommand == cur_cmd.subcommand:
+						continue
+					process_command(cur_cmd)
+
+			# Cleanup the scheduler thread
+			scheduler_thread.join()
 		
 		# Indicate the thread is ending
 		self._logger.debug('Display thread closing')
 			
+	#---------------------------------------------------------------------------
+	# stop Method
+	#---------------------------------------------------------------------------
+	def stop(self):
+		# types: () -> None
+		# Wake the thread from its poll delay so it sees the kill event straight away
+		self._cmd_q.put(())
+
 	#---------------------------------------------------------------------------
 	# process_message Method
 	#---------------------------------------------------------------------------
 	def process_message(self, command):
 		# types: (DisplayPacket) -> None
+		# Hand the command to the display thread - nothing to do if the display is not connected
+		if not self._display_error:
+			self._cmd_q.put((command.packet,))
+
+	#---------------------------------------------------------------------------
+	# process_batch Method
+	#---------------------------------------------------------------------------
+	def process_batch(self, commands):
+		# types: (DisplayPacket) -> None
+		# Hand the whole list of commands to the display thread with a single queue operation
+		if not self._display_error:
+			self._cmd_q.put(commands.packet)
+
+	#---------------------------------------------------------------------------
+	# _queue_status Method
+	#---------------------------------------------------------------------------
+	def _queue_status(self, target, value):
+		# types: (int, object) -> None
+		# Queue a display update from one of the display's own tasks, to be written by the display thread
+		self._cmd_q.put((messaging.Command(SET_STATUS, target, value),))
+
+	#---------------------------------------------------------------------------
+	# _process_command Method
+	#---------------------------------------------------------------------------
+	def _process_command(self, cur_cmd):
+		# types: (Command) -> None
 		# Evaluate the message
-		cur_cmd = command.packet
 		if cur_cmd.command == SET_STATUS:
-			# Check the subcommand
-			if cur_cmd.subcommand == PROGRAM_BTN:
-				self._update_btn(PROGRAM_BTN_ADD, cur_cmd.data)
-			elif cur_cmd.subcommand == RELAY_LED:
-				self._update_led(RELAY_LED_ADD, cur_cmd.data)
-			elif cur_cmd.subcommand == OVER_BTN:
-				self._update_btn(OVER_BTN_ADD, cur_cmd.data)
-			elif cur_cmd.subcommand == OVER_SCALE:
-				self._update_scale(TRACKBAR_ADD, cur_cmd.data)
-			elif cur_cmd.subcommand == INSIDE_TEMP:
-				self._update_string(INTEMP_ADD, cur_cmd.data)
-			elif cur_cmd.subcommand == OUTSIDE_TEMP:
-				self._update_string(OUTTEMP_ADD, cur_cmd.data)
-			elif cur_cmd.subcommand == SETPOINT_TEMP:
-				self._update_string(SETPOINT_ADD, cur_cmd.data)
-			elif cur_cmd.subcommand == POWER_LED:
-				self._update_led(POWER_LED_ADD, cur_cmd.data)
+			# Look up the handler and display address for the subcommand
+			handler = self._status_handlers.get(cur_cmd.subcommand)
+			if handler:
+				update_method, address = handler
+				update_method(address, cur_cmd.data)
+			else:
+				self._logger.error('  Unknown display subcommand %s - no action taken', cur_cmd.subcommand)
 		else:
 			self._logger.error('  Display message unrecognized - no action taken')
 
@@ -217,12 +307,10 @@ class DisplayControl(threading.Thread):
 		# types: (int, int) -> None
 		# Only update is the display is connected
 		if not self._display_error:
-			if status == BTN_ON:
-				self._logger.debug('  Received message to turn on a power button')
-				geniePi.genieWriteObj(geniePi.GENIE_OBJ_4DBUTTON, address, BTN_ON)
-			else:
-				self._logger.debug('  Received message to turn off a power button')
-				geniePi.genieWriteObj(geniePi.GENIE_OBJ_4DBUTTON, address, BTN_OFF)
+			is_on = status == BTN_ON
+			if self._debug_logging:
+				self._logger.debug('  Received message to turn %s a power button', 'on' if is_on else 'off')
+			self._write_obj(geniePi.GENIE_OBJ_4DBUTTON, address, BTN_ON if is_on else BTN_OFF)
 
 	#---------------------------------------------------------------------------
 	# _update_relay_led Method
@@ -231,12 +319,10 @@ class DisplayControl(threading.Thread):
 		# types: (int, int) -> None
 		# Only update if the display is connected
 		if not self._display_error:
-			if status == LED_ON:
-				self._logger.debug('  Received message to turn on a LED')
-				geniePi.genieWriteObj(geniePi.GENIE_OBJ_USER_LED, address, LED_ON)
-			else:
-				self._logger.debug('  Received message to turn off a LED')
-				geniePi.genieWriteObj(geniePi.GENIE_OBJ_USER_LED, address, LED_OFF)
+			is_on = status == LED_ON
+			if self._debug_logging:
+				self._logger.debug('  Received message to turn %s a LED', 'on' if is_on else 'off')
+			self._write_obj(geniePi.GENIE_OBJ_USER_LED, address, LED_ON if is_on else LED_OFF)
 
 	#---------------------------------------------------------------------------
 	# _update_string Method
@@ -244,8 +330,9 @@ class DisplayControl(threading.Thread):
 	def _update_string(self, address, text):
 		# types: (int, string) -> None
 		# Only update if the display is connected
-		if not self._display_error:
+		if not self._display_error and self._display_text.get(address) != text:
 			geniePi.genieWriteStr(address, text)
+			self._display_text[address] = text
 
 	#---------------------------------------------------------------------------
 	# _update_scale Method
@@ -255,15 +342,75 @@ class DisplayControl(threading.Thread):
 		# Only update if the display is connected
 		if not self._display_error:
 			scale_index = int(setting - 15.0)   # This is set for now assuming a single trackbar - may need to be changed if more trackbars added
-			geniePi.genieWriteObj(geniePi.GENIE_OBJ_TRACKBAR, address, scale_index)
+			self._write_obj(geniePi.GENIE_OBJ_TRACKBAR, address, scale_index)
+
+	#---------------------------------------------------------------------------
+	# _update_icon Method
+	#---------------------------------------------------------------------------
+	def _update_icon(self, address, icon):
+		# types: (int, int) -> None
+		# Only update if the display is connected
+		if not self._display_error:
+			self._write_obj(geniePi.GENIE_OBJ_USERIMAGES, address, icon)
+
+	#---------------------------------------------------------------------------
+	# _write_obj Method
+	#---------------------------------------------------------------------------
+	def _write_obj(self, object_type, address, value):
+		# types: (int, int, int) -> None
+		# Skip the serial write if the display already shows this value
+		key = (object_type, address)
+		if self._display_state.get(key) != value:
+			geniePi.genieWriteObj(object_type, address, value)
+			self._display_state[key] = value
+
+	#---------------------------------------------------------------------------
+	# _read_obj Method
+	#---------------------------------------------------------------------------
+	def _read_obj(self, object_type, address):
+		# types: (int, int) -> int
+		# Answer from the shadow copy, only asking the display if the value has never been written or reported
+		key = (object_type, address)
+		value = self._display_state.get(key)
+		if value is None:
+			value = geniePi.genieReadObj(object_type, address)
+			self._display_state[key] = value
+		return value
+
+	#---------------------------------------------------------------------------
+	# _on_override_btn Method
+	#---------------------------------------------------------------------------
+	def _on_override_btn(self, status):
+		# types: (int) -> None
+		# Only allow this to change state if the thermostat power is on
+		thermo_status = self._read_obj(geniePi.GENIE_OBJ_4DBUTTON, PROGRAM_BTN_ADD)
+		if thermo_status:
+			self._update_override(status, self._setpoint)
+		else:  # Revert the override status to its initial state
+			prev_override_status = BTN_OFF if status else BTN_ON
+			self._write_obj(geniePi.GENIE_OBJ_4DBUTTON, OVER_BTN_ADD, prev_override_status)
+
+	#---------------------------------------------------------------------------
+	# _on_trackbar Method
+	#---------------------------------------------------------------------------
+	def _on_trackbar(self, setting):
+		# types: (int) -> None
+		# Update the internal setpoint register
+		self._setpoint = 15 + setting
+
+		# Update the thermostat controller iff override mode is on
+		override_status = self._read_obj(geniePi.GENIE_OBJ_4DBUTTON, OVER_BTN_ADD)
+		if self._debug_logging:
+			self._logger.debug('    Current display override status: %i', override_status)
+		if override_status:  # The override mode is on
+			self._update_override(override_status, self._setpoint)
 
 	#---------------------------------------------------------------------------
 	# _update_power Method
 	#---------------------------------------------------------------------------
 	def _update_power_status(self, status):
 		# Create the packet and send to the thermostat
-		button_status = thermostat.STATUS_ON if status == BTN_ON else thermostat.STATUS_OFF
-		data_packet = messaging.DisplayPacket(messaging.Command(thermostat.CMD_THERMO_POWER, button_status, None))
+		data_packet = messaging.DisplayPacket(messaging.Command(thermostat.CMD_THERMO_POWER, self._btn_status[status == BTN_ON], None))
 		self._ehandler(messaging.ThermostatTxMessage(data_packet))
 
 	#---------------------------------------------------------------------------
@@ -271,33 +418,33 @@ class DisplayControl(threading.Thread):
 	#---------------------------------------------------------------------------
 	def _update_override(self, status, setpoint):
 		# Create the packet and send to the thermostat
-		button_status = thermostat.STATUS_ON if status == BTN_ON else thermostat.STATUS_OFF
-		data_packet = messaging.DisplayPacket(messaging.Command(thermostat.CMD_OVERRIDE, button_status, setpoint))
+		data_packet = messaging.DisplayPacket(messaging.Command(thermostat.CMD_OVERRIDE, self._btn_status[status == BTN_ON], setpoint))
 		self._ehandler(messaging.ThermostatTxMessage(data_packet))
 
 
 #===============================================================================
-# ClockController Class
+# DisplayScheduler Class
 #===============================================================================
-# Implements a class that updates the clock on the display
+# Implements a single thread that runs the periodic display tasks.  Each task
+# provides an update() method that returns the delay in seconds until it should
+# next be run.
 #
 # Class Members
 #	_kill_event	    :	The event signaling a shutdown of the thread
-#	_display_error  : 	Indicates if there is an error with the display
-#   _prev_datetime  :   The datetime currently displayed
+#   _tasks          :   The periodic tasks to run
 #
-class ClockController(threading.Thread):
+class DisplayScheduler(threading.Thread):
 	#---------------------------------------------------------------------------
 	# Constructor
 	#---------------------------------------------------------------------------
-	def __init__(self, kill_event, display_error):
+	def __init__(self, kill_event, tasks):
+		# types: (event, list) -> none
 		# Initialize variables
 		self._kill_event = kill_event
-		self._display_error = display_error
-		self._prev_datetime = ''
+		self._tasks = tasks
 
 		# Initialize logger
-		self._logger = logging.getLogger('MAIN.DISPLAY.CLOCK')
+		self._logger = logging.getLogger('MAIN.DISPLAY.SCHEDULER')
 
 		# Initialize as a thread
 		threading.Thread.__init__(self)
@@ -306,19 +453,67 @@ class ClockController(threading.Thread):
 	# run method
 	#---------------------------------------------------------------------------
 	def run(self):
-		# Infinite look until event signalling exit
-		self._logger.debug('Starting clock thread')
+		# Queue all tasks to run immediately - the index keeps tasks with the same deadline from being compared
+		self._logger.debug('Starting display scheduler thread')
+		now = time.monotonic()	# Deadlines are monotonic, so a wall clock step cannot stall the tasks
+		schedule = [ (now, index, task) for index, task in enumerate(self._tasks) ]
+		heapq.heapify(schedule)
+
+		# Infinite loop until event signalling exit
 		while not self._kill_event.is_set():
-			# Get the current time as a string, and update display if different
-			datetime_str = datetime.now().strftime('%A, %B %d  %H:%M')
-			if (datetime_str != self._prev_datetime) and not self._display_error:
-				geniePi.genieWriteStr(CLOCK_ADD, datetime_str)
-				self._prev_datetime = datetime_str
+			# Wait until the next task is due
+			deadline, index, task = schedule[0]
+			delay = deadline - time.monotonic()
+			if delay > 0:
+				self._kill_event.wait(delay)
+				continue	# Recheck the kill event and the deadline after waking
 
-			# Delay between date string updates - will give reasonable lag for the clock update
-			self._kill_event.wait(1)  # 1 second
+			# Run the task and reschedule it from when it started, so time spent in the update does not add drift
+			start = time.monotonic()
+			heapq.heapreplace(schedule, (start + task.update(), index, task))
 
-		self._logger.debug('Clock thread exiting.')
+		self._logger.debug('Display scheduler thread exiting.')
+
+
+#===============================================================================
+# ClockController Class
+#===============================================================================
+# Implements a class that updates the clock on the display
+#
+# Class Members
+#	_send_status    : 	The callback that queues a display update for the display thread
+#   _date_prefix    :   The formatted date part of the clock string for the current day
+#   _date_prefix_day:   The day of the month the date prefix was formatted for
+#
+class ClockController(object):
+	#---------------------------------------------------------------------------
+	# Constructor
+	#---------------------------------------------------------------------------
+	def __init__(self, send_status):
+		# Initialize variables
+		self._send_status = send_status
+		self._date_prefix = ''
+		self._date_prefix_day = None
+
+		# Initialize logger
+		self._logger = logging.getLogger('MAIN.DISPLAY.CLOCK')
+
+	#---------------------------------------------------------------------------
+	# update method
+	#---------------------------------------------------------------------------
+	def update(self):
+		# types: () -> float
+		# Get the current time as a string and update the display - only called as the minute changes
+		now = datetime.now()
+
+		# The date part only changes once a day, so only format it then
+		if now.day != self._date_prefix_day:
+			self._date_prefix = now.strftime('%A, %B %d  ')
+			self._date_prefix_day = now.day
+		self._send_status(CLOCK_TIME, '%s%02i:%02i' % (self._date_prefix, now.hour, now.minute))
+
+		# Delay until just after the start of the next minute, when the displayed string will next change
+		return 60 - now.second - now.microsecond/1e6 + CLOCK_MARGIN
 
 
 #===============================================================================
@@ -327,133 +522,167 @@ class ClockController(threading.Thread):
 # Implements a class that updates the weather displayed on the screen
 #
 # Class Members
-#	_kill_event	    :	The event signaling a shutdown of the thread
-#	_display_error  : 	Indicates if there is an error with the display
+#	_send_status    : 	The callback that queues a display update for the display thread
 #   _current_icon   :   Indicates the icon that is currently displayed
+#   _opener         :   The URL opener reused for every weather request
+#   _etag           :   The ETag of the last weather data received
+#   _last_modified  :   The Last-Modified date of the last weather data received
+#   _fresh_until    :   The time until which the server allows the last weather data to be reused
+#   _fetch_thread   :   The thread running the most recent weather request
 #
-class WeatherDisplay(threading.Thread):
+class WeatherDisplay(object):
 	#---------------------------------------------------------------------------
 	# Constructor
 	#---------------------------------------------------------------------------
-	def __init__(self, kill_event, display_error):
+	def __init__(self, send_status):
 		# Initialize variables
-		self._kill_event = kill_event
-		self._display_error = display_error
-		self._prev_datetime = ''
+		self._send_status = send_status
 		self._current_icon = WX_SUNNY
+		self._opener = urllib.request.build_opener()
+		self._etag = None
+		self._last_modified = None
+		self._fresh_until = 0
+		self._fetch_thread = None
 
 		# Initialize logger
 		self._logger = logging.getLogger('MAIN.DISPLAY.WEATHER')
 
-		# Initialize as a thread
-		threading.Thread.__init__(self)
+	#---------------------------------------------------------------------------
+	# update method
+	#---------------------------------------------------------------------------
+	def update(self):
+		# types: () -> float
+		# Skip the request entirely while the server says the last data is still current
+		now = time.time()
+		if now < self._fresh_until:
+			self._logger.debug('  Weather data still fresh for %i seconds - no request sent', self._fresh_until - now)
+			return WEATHER_PERIOD
+
+		# Fetch in the background so a slow server does not hold up the other display tasks
+		if self._fetch_thread is not None and self._fetch_thread.is_alive():
+			self._logger.warning('  Previous weather request still running - skipping update')
+		else:
+			self._fetch_thread = threading.Thread(target=self._fetch, name='WeatherFetch')
+			self._fetch_thread.daemon = True	# Bounded by the request timeout, but not worth holding up shutdown for
+			self._fetch_thread.start()
+
+		# Check again after the update period
+		return WEATHER_PERIOD
 
 	#---------------------------------------------------------------------------
-	# run method
+	# _fetch method
 	#---------------------------------------------------------------------------
-	def run(self):
-		# Infinite look until event signalling exit
-		self._logger.debug('Starting weather display thread')
-		while not self._kill_event.is_set():
-			# Get the latest weather as an xml printout
-			url_address = 'https://www.aviationweather.gov/adds/dataserver_current/httpparam?dataSource=metars&requestType=retrieve&format=xml&stationString=cytz&hoursBeforeNow=2'
-			try:
-				self._logger.debug('  Getting weather from internet')
-				url_response = urllib2.urlopen(url_address)
-				xml_data = url_response.read()
-			except urllib2.URLError as url_error:
-				if hasattr(url_error, 'reason'):
-					self._logger.error('  Could not reach the server: %s', url_error.reason)
-				elif hasattr(url_error, 'code'):
-					self._logger.error('  The server could not fulfill the request: %s', url_error.code)
-			except:
-				self._logger.error('  Unknown error thrown by attempt to read weather from the internet - skipping update')
+	def _fetch(self):
+		# types: () -> None
+		# Get the latest weather as an xml printout
+		now = time.time()
+		url_address = 'https://www.aviationweather.gov/adds/dataserver_current/httpparam?dataSource=metars&requestType=retrieve&format=xml&stationString=cytz&hoursBeforeNow=2'
+		request = urllib.request.Request(url_address)
+		if self._etag:
+			request.add_header('If-None-Match', self._etag)
+		if self._last_modified:
+			request.add_header('If-Modified-Since', self._last_modified)
+		try:
+			self._logger.debug('  Getting weather from internet')
+			url_response = self._opener.open(request, timeout=WEATHER_TIMEOUT)
+
+			# Parse as the data arrives and stop at the first METAR, which is the most recent (can include SPECI's)
+			metar = None
+			for event, element in ET.iterparse(url_response):
+				if element.tag == 'METAR':
+					metar = element
+					break
+			url_response.close()
+		except urllib.error.HTTPError as http_error:
+			if http_error.code == 304:  # Not modified, so the displayed icon is still correct
+				self._logger.debug('  Weather unchanged since the last update - no display update')
+				self._fresh_until = now + self._max_age(http_error.info())
 			else:
-				# Get the node with the most recent weather data
-				xml_root = ET.fromstring(xml_data)
-				metar_list = xml_root.findall('./data/METAR')
-				if len(metar_list) > 0:
-					metar = metar_list[0]  # Get the latest METAR update despite type (can include SPECI's)
-					new_icon = None
-
-					# Determine if there is precipitation (implies that we don't have to worry about cloud type, just type of precip)
-					self._logger.debug('  METAR present, checking for any precipitation')
-					if metar.find('./wx_string') is not None:  # We have possible precipitation, need to check the remarks
-						wx_string = metar.find('./wx_string').text  # Get the string describing conditions
-						self._logger.debug('    Found weather string: %s', wx_string)
-
-						# Check for types of rain
-						if 'TS' in wx_string:  # Check for thunderstorms
-							new_icon = WX_TSTORM
-							self._logger.debug('    Thunderstorms present')
-						elif 'FZ' in wx_string:  # Check for freezing rain
-							new_icon = WX_FZ_RAIN
-							self._logger.debug('    Freezing rain present')
-						elif 'SN' in wx_string:  # Check for snow
-							if 'SH' in wx_string:  # Further check for snow showers
-								new_icon = WX_SCAT_SNOW
-								self._logger.debug('    Scattered snow showers present')
-							else:
-								new_icon = WX_SNOW
-								self._logger.debug('    Snow present')
-						elif ('RA' in wx_string) or ('DZ' in wx_string):  # Finally, see if there is plain old rain
-							if 'SH' in wx_string:  # Further check for showers
-								new_icon = WX_SHOWERS
-								self._logger.debug('    Rain showers present')
-							else:
-								new_icon = WX_RAIN
-								self._logger.debug('    Rain present')
-
-					# If no icon found for precipitation, check cloud types
-					if new_icon is None:
-						# Get all sky conditions and iterate through them
-						self._logger.debug('  No precipitation present, checking cloud layers (assuming sunny skies to start)')
-						new_icon = WX_SUNNY  # Default to no coverage, or sunny skies
-						for layer in metar.findall('./sky_condition'):
-							if 'cloud_base_ft_agl' not in layer.keys():  # Check that a cloud base is defined - won't be for clear skies
-								self._logger.debug('    Evaluating layer %s', layer.attrib['sky_cover'])
-								if layer.attrib['sky_cover'] == 'SKC' or layer.attrib['sky_cover'] == 'CLR':
-									# Call this condition sunny skies and break out of the loop (not likely needed)
-									new_icon = WX_SUNNY
-									self._logger.debug('    Confirmed clear skies')
+				self._logger.error('  The server could not fulfill the request: %s', http_error.code)
+		except urllib.error.URLError as url_error:
+			if hasattr(url_error, 'reason'):
+				self._logger.error('  Could not reach the server: %s', url_error.reason)
+			elif hasattr(url_error, 'code'):
+				self._logger.error('  The server could not fulfill the request: %s', url_error.code)
+		except:
+			self._logger.error('  Unknown error thrown by attempt to read weather from the internet - skipping update')
+		else:
+			# Remember the validators so the next request only downloads changed data
+			headers = url_response.info()
+			self._etag = headers.get('ETag')
+			self._last_modified = headers.get('Last-Modified')
+			self._fresh_until = now + self._max_age(headers)
+
+			# Check the node with the most recent weather data
+			if metar is not None:
+				new_icon = None
+
+				# Determine if there is precipitation (implies that we don't have to worry about cloud type, just type of precip)
+				self._logger.debug('  METAR present, checking for any precipitation')
+				wx_node = metar.find('wx_string')
+				if wx_node is not None:  # We have possible precipitation, need to check the remarks
+					wx_string = wx_node.text  # Get the string describing conditions
+					self._logger.debug('    Found weather string: %s', wx_string)
+
+					# Take the first type of precipitation present, in order of precedence
+					for wx_code, steady_icon, shower_icon in PRECIP_RULES:
+						if wx_code in wx_string:
+							new_icon = shower_icon if 'SH' in wx_string else steady_icon
+							self._logger.debug('    Precipitation %s present, using icon %i', wx_code, new_icon)
+							break
+
+				# If no icon found for precipitation, check cloud types
+				if new_icon is None:
+					# Get all sky conditions and iterate through them
+					self._logger.debug('  No precipitation present, checking cloud layers (assuming sunny skies to start)')
+					new_icon = WX_SUNNY  # Default to no coverage, or sunny skies
+					for layer in metar.iter('sky_condition'):
+						layer_attrib = layer.attrib
+						sky_cover = layer_attrib.get('sky_cover')
+						cloud_base = layer_attrib.get('cloud_base_ft_agl')
+						if cloud_base is None:  # Check that a cloud base is defined - won't be for clear skies
+							self._logger.debug('    Evaluating layer %s', sky_cover)
+							if sky_cover in CLEAR_SKY_COVERS:
+								# Call this condition sunny skies and break out of the loop (not likely needed)
+								new_icon = WX_SUNNY
+								self._logger.debug('    Confirmed clear skies')
+								break
+						elif int(cloud_base) <= 12000:  # Need to evaluate the sky condition below 12,000 ft
+							self._logger.debug('    Evaluating layer %s at %s', sky_cover, cloud_base)
+							layer_icon = SKY_COVER_ICONS.get(sky_cover)
+							if layer_icon is not None and new_icon < layer_icon:
+								new_icon = layer_icon
+								self._logger.debug('      Icon will be updated to %i based on this layer', new_icon)
+								if new_icon == WX_OVC_CLOUDS:  # No higher layer can add more coverage
 									break
-							elif int(layer.attrib['cloud_base_ft_agl']) <= 12000:  # Need to evaluate the sky condition below 12,000 ft
-								self._logger.debug('    Evaluating layer %s at %s', layer.attrib['sky_cover'], layer.attrib['cloud_base_ft_agl'])
-								if layer.attrib['sky_cover'] == 'FEW':
-									self._logger.debug('    Evaluating this few clouds layer')
-									if new_icon < WX_FEW_CLOUDS:
-										new_icon = WX_FEW_CLOUDS  # Treat this as sunny skies
-										self._logger.debug('      Icon will be updated to WX_FEW_CLOUDS based on this layer')
-								elif layer.attrib['sky_cover'] == 'SCT':
-									self._logger.debug('    Evaluating this scattered layer')
-									if new_icon < WX_SCT_CLOUDS:
-										new_icon = WX_SCT_CLOUDS
-										self._logger.debug('      Icon will be updated to WX_SCT_CLOUDS based on this layer')
-								elif layer.attrib['sky_cover'] == 'BKN':
-									self._logger.debug('    Evaluating this broken layer')
-									if new_icon < WX_OVC_CLOUDS:
-										new_icon = WX_OVC_CLOUDS
-										self._logger.debug('      Icon will be updated to WX_OVC_CLOUDS based on this layer')
-								elif layer.attrib['sky_cover'] == 'OVC':
-									self._logger.debug('    Evaluating this overcast layer')
-									if new_icon < WX_OVC_CLOUDS:
-										new_icon = WX_OVC_CLOUDS
-										self._logger.debug('      Icon will be updated to WX_OVC_CLOUDS based on this layer')
-							else:  # Level too high
-								self._logger.debug('  Layer %s with bases at %s ignored due to height', layer.attrib['sky_cover'], layer.attrib['cloud_base_ft_agl'])
-
-					# Update the weather display if a new icon is needed
-					if self._current_icon != new_icon:
-						self._logger.debug('  Icon is different than currently displayed - display updating')
-						self._current_icon = new_icon
-						geniePi.genieWriteObj(geniePi.GENIE_OBJ_USERIMAGES, WEATHER_ADD, self._current_icon)
-					else:
-						self._logger.debug('  Icon is same as currently displayed - no display update')
-
-				else:  # No METAR information, so do not update the display
-					self._logger.debug('  No METAR data to update weather display.')
-
-			# Delay between date string updates - will give reasonable lag for the clock update
-			self._kill_event.wait(15*60)  # 15 minutes
-
-		self._logger.debug('Weather display thread exiting.')
+						else:  # Level too high
+							self._logger.debug('  Layer %s with bases at %s ignored due to height', sky_cover, cloud_base)
+
+				# Update the weather display if a new icon is needed
+				if self._current_icon != new_icon:
+					self._logger.debug('  Icon is different than currently displayed - display updating')
+					self._current_icon = new_icon
+					self._send_status(WEATHER_ICON, new_icon)	# Written by the display thread, the only one using the serial link
+				else:
+					self._logger.debug('  Icon is same as currently displayed - no display update')
+
+			else:  # No METAR information, so do not update the display
+				self._logger.debug('  No METAR data to update weather display.')
+
+	#---------------------------------------------------------------------------
+	# _max_age method
+	#---------------------------------------------------------------------------
+	@staticmethod
+	def _max_age(headers):
+		# types: (http.client.HTTPMessage) -> int
+		# Find the max-age Cache-Control directive, treating the data as stale if there is none
+		cache_control = headers.get('Cache-Control') if headers else None
+		if cache_control:
+			for directive in cache_control.split(','):
+				directive = directive.strip()
+				if directive.startswith('max-age='):
+					try:
+						return int(directive[8:])
+					except ValueError:
+						break
+		return 0
@@ -29,6 +29,7 @@
 
 # Imports
 import time
+import pigpio
 from i2cbus import I2CBus
 
 # Constants
@@ -42,6 +43,11 @@ HTU21D_WRITE_USER_REGISTER	= 0xE6
 HTU21D_READ_USER_REGISTER	= 0xE7
 HTU21D_SOFT_RESET			= 0xFE
 
+HTU21D_TEMPERATURE_WAIT		= 0.044	# Typical 14 bit temperature conversion time in seconds (50 ms maximum)
+HTU21D_HUMIDITY_WAIT		= 0.014	# Typical 12 bit humidity conversion time in seconds (16 ms maximum)
+HTU21D_POLL_DELAY			= 0.005	# Delay in seconds between reads while the chip is still converting
+HTU21D_POLL_LIMIT			= 4		# Number of early reads before a final read that reports any error
+
 #===============================================================================
 # HTU21D Class
 #===============================================================================
@@ -81,18 +87,8 @@ class HTU21D(I2CBus):
 		Read the current temperature on the HTU21D
 		:return: The temperature in degrees Celcius
 		"""
-		# Signal for measurement and wait
 		self._write([HTU21D_TEMPERATURE_NOHOLD])
-		time.sleep(0.06)	# The chip needs up to 50 ms
-		
-		# Read the measurement
-		data = self._read(3)
-		
-		# Convert to temperature
-		raw_temp = (data[0] << 8) | data[1]
-		raw_temp &= 0xFFFC	# Remove any status bits
-		
-		return 175.72*(raw_temp/65536.0) - 46.85
+		return self._to_temperature(self._await_result(HTU21D_TEMPERATURE_WAIT))
 
 	#---------------------------------------------------------------------------
 	# read_humidity Method
@@ -103,14 +99,54 @@ class HTU21D(I2CBus):
 		Read the current humidity on the HTU21D
 		:return: The humidity in percent relative humidity
 		"""
-		# Signal for measurement and wait
 		self._write([HTU21D_HUMIDITY_NOHOLD])
-		time.sleep(0.06)	# The chip needs up to 50 ms
-		
-		# Read the measurement
-		data = self._read(3)
+		return self._to_humidity(self._await_result(HTU21D_HUMIDITY_WAIT))
+
+	#---------------------------------------------------------------------------
+	# _await_result Method
+	#---------------------------------------------------------------------------
+	def _await_result(self, wait):
+		# types: (double) -> list
+		"""
+		Read a triggered no hold measurement as soon as the chip is done
+		:param wait: The typical conversion time in seconds
+		:return: The measurement and checksum bytes
+		"""
+		# Wait for the typical conversion time
+		time.sleep(wait)
+
+		# The chip NACKs reads until the conversion is complete, so poll until it is ready
+		for attempt in range(HTU21D_POLL_LIMIT):
+			try:
+				data = self._read(3)
+			except pigpio.error:
+				data = None
+			if data and len(data) == 3:
+				return data
+			time.sleep(HTU21D_POLL_DELAY)
+
+		# Last attempt, letting any error reach the caller
+		return self._read(3)
+
+	#---------------------------------------------------------------------------
+	# _to_temperature Method
+	#---------------------------------------------------------------------------
+	@staticmethod
+	def _to_temperature(data):
+		# types: (list) -> double
+		# Convert to temperature
+		raw_temp = (data[0] << 8) | data[1]
+		raw_temp &= 0xFFFC	# Remove any status bits
 		
-		# Convert to humidity and return
+		return 175.72*(raw_temp/65536.0) - 46.85
+
+	#---------------------------------------------------------------------------
+	# _to_humidity Method
+	#---------------------------------------------------------------------------
+	@staticmethod
+	def _to_humidity(data):
+		# types: (list) -> double
+		# Convert to humidity
 		raw_humidity = (data[0] << 8) | data[1]
 		raw_humidity &= 0xFFFC	# Remove the status bits
 		
@@ -41,6 +41,7 @@ import pigpio	# For GPIO control
 #				(if x is _bus_num, the bus is /dev/i2c-x)
 #	_address:	The address of the I2C device
 #	_bus:		The object containing the I2C bus interface
+#	_handle:	The handle of the open I2C device, kept for the life of the object
 #
 class I2CBus:
 	#---------------------------------------------------------------------------
@@ -56,6 +57,19 @@ class I2CBus:
 		self._bus_num = bus_number	# The bus number on the Pi
 		self._address = address		# The address of the I2C device
 		self._bus = pigpio.pi()		# The interface object for the bus
+		self._handle = self._bus.i2c_open(self._bus_num, self._address)	# Opened once and reused for every transfer
+
+	#---------------------------------------------------------------------------
+	# close Method
+	#---------------------------------------------------------------------------
+	# Release the device and the bus interface
+	def close(self):
+		# types: () -> none
+		"""
+		Closes the I2C device handle and the connection to the bus
+		"""
+		self._bus.i2c_close(self._handle)
+		self._bus.stop()
 		
 	#---------------------------------------------------------------------------
 	# _write Method
@@ -67,9 +81,7 @@ class I2CBus:
 		Write data to the I2C device
 		:param msg_buffer: The bytes to send
 		"""
-		handle = self._bus.i2c_open(self._bus_num, self._address)
-		self._bus.i2c_write_device(handle, msg_buffer)	# Write bytes to device
-		self._bus.i2c_close(handle)
+		self._bus.i2c_write_device(self._handle, msg_buffer)	# Write bytes to device
 	
 	#---------------------------------------------------------------------------
 	# _read Method
@@ -82,9 +94,7 @@ class I2CBus:
 		:param size: The number of byte to read from the device
 		:return: The bytes read from the device
 		"""
-		handle = self._bus.i2c_open(self._bus_num, self._address)
-		(count, data) = self._bus.i2c_read_device(handle, size)
-		self._bus.i2c_close(handle)
+		(count, data) = self._bus.i2c_read_device(self._handle, size)
 		
 		return data
 	
@@ -99,9 +109,7 @@ class I2CBus:
 		:param register: The register to write to
 		:param msg_buffer: The list of commands to send to the register
 		"""
-		handle = self._bus.i2c_open(self._bus_num, self._address)
-		self._bus.i2c_write_i2c_block_data(handle, register, msg_buffer)
-		self._bus.i2c_close(handle)
+		self._bus.i2c_write_i2c_block_data(self._handle, register, msg_buffer)
 	
 	#---------------------------------------------------------------------------
 	# _read_register Method
@@ -115,8 +123,6 @@ class I2CBus:
 		:param size: The number of bytes to read from the register
 		:return: The bytes read from the device
 		"""
-		handle = self._bus.i2c_open(self._bus_num, self._address)
-		(count, data) = self._bus.i2c_read_i2c_block_data(handle, register, size)
-		self._bus.i2c_close(handle)
+		(count, data) = self._bus.i2c_read_i2c_block_data(self._handle, register, size)
 		
 		return data
@@ -28,19 +28,32 @@
 
 # Imports
 import threading
+import queue
 import messaging
-import httplib
+import http.client
 import logging
 import socket
 import select
+import os
+import errno
 import thermostat
 
 #===============================================================================
 # CONSTANTS
 #===============================================================================
-SOCKET_DELAY			= 0.1	# Delay in seconds for socket client read
 SOCKET_MESSAGE_LENGTH	= 50	# Maximum length for a LAN command
 
+# Command Fields
+ON_OFF_STATUS			= { 'ON': thermostat.STATUS_ON, 'OFF': thermostat.STATUS_OFF }	# Thermostat status for an ON/OFF field
+
+# Fixed Commands - these carry no data and are never modified, so one instance is shared by every request
+POWER_COMMANDS			= {
+	'ON':	messaging.Command(thermostat.CMD_THERMO_POWER, thermostat.STATUS_ON, None),
+	'OFF':	messaging.Command(thermostat.CMD_THERMO_POWER, thermostat.STATUS_OFF, None) }
+TIME_COMMAND			= messaging.Command(thermostat.CMD_TIME_REQUEST, thermostat.STATUS_GET, None)
+STATUS_COMMAND			= messaging.Command(thermostat.CMD_STATUS, None, None)
+SHUTDOWN_COMMAND		= messaging.Command(thermostat.CMD_SHUTDOWN, None, None)
+
 #===============================================================================
 # LANMessages Class
 #===============================================================================
@@ -48,6 +61,18 @@ SOCKET_MESSAGE_LENGTH	= 50	# Maximum length for a LAN command
 #
 # Class Members
 #	_ehandler:	The callback function that will handle incoming LAN messages
+#	_rx_buffers:	The receive buffer for each connected client socket
+#	_peers:		The (host, port) address of each connected client socket
+#	_command_handlers:	Maps LAN command types to the method that builds the thermostat command
+#	_descriptors:	Maps the file number of the server and each client socket to the socket
+#	_poller:	The epoll object watching the sockets and the wake pipe
+#	_wake_read:	The read end of the pipe used to wake the select loop for shutdown
+#	_wake_write:	The write end of the pipe used to wake the select loop for shutdown
+#	_httpconn:	The persistent HTTP connection to the database, reopened as needed
+#	_http_lock:	Serializes use of the HTTP connection
+#	_http_q:	Queue of HTTP requests waiting for the sender thread, ended by None
+#	_http_thread:	The thread that sends the queued HTTP requests
+#	_debug_logging:	Indicates if debug messages are being logged
 #
 class LANNetwork(threading.Thread):
 	#---------------------------------------------------------------------------
@@ -60,14 +85,34 @@ class LANNetwork(threading.Thread):
 
 		# Initialize logger
 		self._logger = logging.getLogger('MAIN.LAN')
+		self._debug_logging = self._logger.isEnabledFor(logging.DEBUG)	# The level is fixed by the config file, so check it once
 		
 		# Initialize the server objects
 		self._port = server_port
 		self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-		self._descriptors = [ self._server ]
+		self._wake_read, self._wake_write = os.pipe()
+		self._descriptors = { self._server.fileno(): self._server }
+		self._poller = select.epoll()
+		self._poller.register(self._server, select.EPOLLIN)
+		self._poller.register(self._wake_read, select.EPOLLIN)
+		self._rx_buffers = {}
+		self._peers = {}
+
+		# Map the LAN command types to their handlers
+		self._command_handlers = {
+			'TS':	self._handle_power,
+			'PO':	self._handle_override,
+			'TR':	self._handle_rule_change,
+			'CR':	self._handle_clock,
+			'ST':	self._handle_status,
+			'XX':	self._handle_shutdown }
 
 		# Set database address on the LAN
 		self._db_address = db_address
+		self._httpconn = http.client.HTTPConnection(self._db_address, timeout=5)  # Set timeout to 5 seconds
+		self._http_lock = threading.Lock()
+		self._http_q = queue.Queue()
+		self._http_thread = threading.Thread(target=self._send_queued_http, name='LANHTTPSender')
 
 		# Initialize as a thread
 		self._kill_event = kill_event
@@ -77,9 +122,11 @@ class LANNetwork(threading.Thread):
 	# Main thread execution
 	#---------------------------------------------------------------------------
 	def run(self):
-		# Open a listening socket
+		# Start sending queued database requests, independent of the listening socket
 		self._logger.debug('Starting LAN thread')
+		self._http_thread.start()
 
+		# Open a listening socket
 		try:
 			# Start listening socket
 			self._server.bind(('', self._port))
@@ -88,26 +135,20 @@ class LANNetwork(threading.Thread):
 
 			# Incoming message listening loop
 			while not self._kill_event.is_set():
-				# Await for activity on the socket for a delay
-				(sread, swrite, sexc) = select.select(self._descriptors, [], [], SOCKET_DELAY)
+				# Await activity on the sockets - stop() wakes this for shutdown
+				events = self._poller.poll()
 
-				# Iterate through any sockets with data to read
-				for sock in sread:
+				# Iterate through any sockets with data to read (or hung up, which reads as closing)
+				for fd, event in events:
 					# Check socket type
-					if sock == self._server:	# Received a new connection
+					if fd == self._wake_read:	# Woken for shutdown, which is checked by the loop
+						os.read(self._wake_read, 1)
+						continue
+					sock = self._descriptors[fd]
+					if sock is self._server:	# Received a new connection
 						self._accept_new_connection()
 					else:	# Activity on an existing socket
-						# Read and check data on socket
-						sock_packet = sock.recv(SOCKET_MESSAGE_LENGTH)
-						host,port = sock.getpeername()
-						if not sock_packet:	# Socket closing
-							sock.close()
-							self._descriptors.remove(sock)
-							self._logger.debug('  Socket from %s:%s closing', host, port)
-						else:	# Data here to process, send to the message queue
-							self._logger.info('Received request from socket on %s:%s', host, port)
-							self._logger.debug('  Message from socket is %s', sock_packet)
-							self._handle_command(host, sock_packet)
+						self._read_client(fd, sock)
 		except socket.error as err:
 			self._logger.error('  Received listening socket error - %s - LAN thread shutting down', str(err))
 			# TODO - Update display to indicate the LAN is not connected
@@ -115,115 +156,238 @@ class LANNetwork(threading.Thread):
 			# Close the listening socket
 			self._server.shutdown(socket.SHUT_RDWR)
 			self._server.close()
+			os.close(self._wake_read)
+			self._poller.close()
 
+		# Wait for the queued HTTP requests to be sent - stop() ends the queue
+		self._http_thread.join()
 		self._logger.debug('LAN thread closing')
 
+	#---------------------------------------------------------------------------
+	# stop Method
+	#---------------------------------------------------------------------------
+	def stop(self):
+		# types: () -> none
+		# Let the HTTP sender finish what is queued and exit
+		self._http_q.put(None)
+
+		# Wake the select loop so it sees the kill event - the read end is already closed if the thread has ended
+		try:
+			os.write(self._wake_write, b'X')
+		except OSError:
+			pass
+		os.close(self._wake_write)
+
 	#---------------------------------------------------------------------------
 	# _handle_command Method
 	#---------------------------------------------------------------------------
 	def _handle_command(self, host_address, command):
 		# types: (string, string) -> none
-		# Parse the command
-		tokens = command.split(':')
-		
-		# Setup data structure based on command
-		command_error = False
-		if tokens[1] == 'TS':	# Thermostat power control
-			# Check if the command is to turn on the thermostat
-			if tokens[2] == 'ON':
-				self._logger.info('  Received LAN command to turn on the thermostat')
-				cmd = messaging.Command(thermostat.CMD_THERMO_POWER, thermostat.STATUS_ON, None)
-			elif tokens[2] == 'OFF':
-				self._logger.info('  Received LAN command to turn off the thermostat')
-				cmd = messaging.Command(thermostat.CMD_THERMO_POWER, thermostat.STATUS_OFF, None)
-			else:
-				self._logger.error('  Received unrecognized thermostat power command %s - no action taken', tokens[2])
-				command_error = True
-			
-		elif tokens[1] == 'PO':	# Program override
-			# Check if the command is to turn the override on
-			if tokens[2] == 'ON':
-				self._logger.info('  Received LAN command to turn on override mode with a setpoint of %s', tokens[3])
-				cmd = messaging.Command(thermostat.CMD_OVERRIDE, thermostat.STATUS_ON, float(tokens[3]))
-			elif tokens[2] == 'OFF':
-				self._logger.info('  Received LAN command to turn off override mode')
-				cmd = messaging.Command(thermostat.CMD_OVERRIDE, thermostat.STATUS_OFF, float(tokens[3]) if len(tokens) >= 4 else None)
-			else:
-				self._logger.error('  Received unrecognized override command %s - no action taken', tokens[2])
-				command_error = True
-				
-		elif tokens[1] == 'TR':	# Thermostat rule change
-			self._logger.warning('  Thermostat rule change logic not implemented yet')
-			command_error = True
+		# Parse the command - only the override setpoint follows the first three fields
+		tokens = command.strip().split(':', 3)
+		if not tokens[0].isdigit():	# Every reply goes back to the port given first, so there is nowhere to send one
+			self._logger.warning('  Received LAN command %s without a reply port - dropped', command)
+			return
+		if len(tokens) < 2:
+			self._logger.warning('  Received malformed LAN command %s - no action taken', command)
+			tokens.append('')
 		
-		elif tokens[1] == 'CR':	# Clock control
-			# Check clock control command
-			if tokens[2] == 'GET':	# Get the current time information
-				self._logger.info('  Received LAN command to get the current thermostat time')
-				cmd = messaging.Command(thermostat.CMD_TIME_REQUEST, thermostat.STATUS_GET, None)
-			else:
-				self._logger.error('  Received unrecognized clock control command %s - no action taken', tokens[2])
-				command_error = True
-			
-		elif tokens[1] == 'ST':	# Thermostat status
-			self._logger.info('  Received LAN command to return the status of the thermostat')
-			cmd = messaging.Command(thermostat.CMD_STATUS, None, None)
-			
-		elif tokens[1] == 'XX':	# Program shutdown
-			self._logger.info('  Received LAN command to shutdown the thermostat program')
-			cmd = messaging.Command(thermostat.CMD_SHUTDOWN, None, None)
-			
-		else:	# Unrecognized command type
+		# Setup data structure based on command type - handlers return None if the command is in error
+		handler = self._command_handlers.get(tokens[1])
+		cmd = None
+		if handler:
+			try:
+				cmd = handler(tokens)
+			except (IndexError, ValueError):
+				self._logger.error('  Received LAN command %s with missing or invalid fields - no action taken', command)
+		elif tokens[1]:	# Unrecognized command type
 			self._logger.warning('  Received LAN command %s was unexpected - no action taken', tokens[1])
-			command_error = True
 		
 		# Pass the command on
-		if not command_error:
+		if cmd is not None:
 			self._ehandler(messaging.ThermostatTxMessage(messaging.DataPacket(host_address, tokens[0], cmd)))
 		else:
 			err_response = tokens[1]
 			err_response += ':NACK' if tokens[1] else 'NACK'
 			self._ehandler(messaging.LANTxMessage(messaging.DataPacket(host_address, tokens[0], err_response)))
+
+	#---------------------------------------------------------------------------
+	# _handle_power Method
+	#---------------------------------------------------------------------------
+	def _handle_power(self, tokens):
+		# types: (list) -> Command
+		# Thermostat power control
+		cmd = POWER_COMMANDS.get(tokens[2])
+		if cmd is None:
+			self._logger.error('  Received unrecognized thermostat power command %s - no action taken', tokens[2])
+			return None
+		self._logger.info('  Received LAN command to turn %s the thermostat', tokens[2].lower())
+		return cmd
+
+	#---------------------------------------------------------------------------
+	# _handle_override Method
+	#---------------------------------------------------------------------------
+	def _handle_override(self, tokens):
+		# types: (list) -> Command
+		# Program override - the setpoint is required to turn it on
+		status = ON_OFF_STATUS.get(tokens[2])
+		if status is None:
+			self._logger.error('  Received unrecognized override command %s - no action taken', tokens[2])
+			return None
+		if status == thermostat.STATUS_ON:
+			self._logger.info('  Received LAN command to turn on override mode with a setpoint of %s', tokens[3])
+			return messaging.Command(thermostat.CMD_OVERRIDE, status, float(tokens[3]))
+		self._logger.info('  Received LAN command to turn off override mode')
+		return messaging.Command(thermostat.CMD_OVERRIDE, status, float(tokens[3]) if len(tokens) >= 4 else None)
+
+	#---------------------------------------------------------------------------
+	# _handle_rule_change Method
+	#---------------------------------------------------------------------------
+	def _handle_rule_change(self, tokens):
+		# types: (list) -> Command
+		# Thermostat rule change
+		self._logger.warning('  Thermostat rule change logic not implemented yet')
+		return None
+
+	#---------------------------------------------------------------------------
+	# _handle_clock Method
+	#---------------------------------------------------------------------------
+	def _handle_clock(self, tokens):
+		# types: (list) -> Command
+		# Clock control
+		if tokens[2] == 'GET':	# Get the current time information
+			self._logger.info('  Received LAN command to get the current thermostat time')
+			return TIME_COMMAND
+		self._logger.error('  Received unrecognized clock control command %s - no action taken', tokens[2])
+		return None
+
+	#---------------------------------------------------------------------------
+	# _handle_status Method
+	#---------------------------------------------------------------------------
+	def _handle_status(self, tokens):
+		# types: (list) -> Command
+		# Thermostat status
+		self._logger.info('  Received LAN command to return the status of the thermostat')
+		return STATUS_COMMAND
+
+	#---------------------------------------------------------------------------
+	# _handle_shutdown Method
+	#---------------------------------------------------------------------------
+	def _handle_shutdown(self, tokens):
+		# types: (list) -> Command
+		# Program shutdown
+		self._logger.info('  Received LAN command to shutdown the thermostat program')
+		return SHUTDOWN_COMMAND
 	
+	#---------------------------------------------------------------------------
+	# _read_client Method
+	#---------------------------------------------------------------------------
+	def _read_client(self, fd, sock):
+		# types: (int, socket) -> none
+		# Read everything waiting on the non-blocking socket, so a burst needs only one wakeup
+		rx_buffer = self._rx_buffers[sock]
+		host,port = self._peers[sock]
+		while True:
+			try:
+				rx_count = sock.recv_into(rx_buffer)
+			except socket.error as err:
+				if err.errno in (errno.EAGAIN, errno.EWOULDBLOCK):	# Nothing more to read
+					return
+				raise
+
+			if not rx_count:	# Socket closing
+				self._poller.unregister(fd)
+				del self._descriptors[fd]
+				sock.close()
+				del self._rx_buffers[sock]
+				del self._peers[sock]
+				self._logger.debug('  Socket from %s:%s closing', host, port)
+				return
+
+			# Data here to process, send to the message queue
+			sock_packet = memoryview(rx_buffer)[:rx_count].tobytes().decode(errors='replace')	# Bad bytes fail the command parse and are NACKed
+			self._logger.info('Received request from socket on %s:%s', host, port)
+			if self._debug_logging:
+				self._logger.debug('  Message from socket is %s', sock_packet.strip())
+			self._handle_command(host, sock_packet)
+
 	#---------------------------------------------------------------------------
 	# _accept_new_connection Method
 	#---------------------------------------------------------------------------
 	def _accept_new_connection(self):
 		newsock, (remhost, remport) = self._server.accept()
-		self._descriptors.append(newsock)
+		newsock.setblocking(False)
+		self._descriptors[newsock.fileno()] = newsock
+		self._poller.register(newsock, select.EPOLLIN)
+		self._rx_buffers[newsock] = bytearray(SOCKET_MESSAGE_LENGTH)
+		self._peers[newsock] = (remhost, remport)
 		self._logger.info('Accepted new connection from %s on port %s', remhost, remport)
 
+	#---------------------------------------------------------------------------
+	# queue_http_request Method
+	#---------------------------------------------------------------------------
+	def queue_http_request(self, GetRequest):
+		# types: (string) -> none
+		# Hand off to the sender thread so the caller does not wait on the network
+		self._http_q.put(GetRequest)
+
+	#---------------------------------------------------------------------------
+	# _send_queued_http Method
+	#---------------------------------------------------------------------------
+	def _send_queued_http(self):
+		# Send requests in order over the kept-alive connection until the end of the queue is signalled
+		while True:
+			GetRequest = self._http_q.get()
+			if GetRequest is None:
+				break
+			self.send_http_request(GetRequest)
+		self._logger.debug('LAN HTTP sender closing')
+
 	#---------------------------------------------------------------------------
 	# send_http_request Method
 	#---------------------------------------------------------------------------
 	def send_http_request(self, GetRequest):
 		# types: (string) -> boolean
-		# Create the HTTP server connection object
+		# Send the request over the kept-alive connection to the database
 		self._logger.debug('  Sending HTTP request to LAN: %s', GetRequest)
-		httpconn = httplib.HTTPConnection(self._db_address, timeout=5)  # Set timeout to 5 seconds
 		success = False  # Assume failure to connect and pass data
-		try:
-			# Send request and read response
-			httpconn.request('GET', GetRequest)
-			httpresp = httpconn.getresponse()
-
-			# Process the response
-			if httpresp.reason == "OK":
-				self._logger.debug('    LAN HTTP response received: OK')
-				success = True
-			else:
-				resp_data = httpresp.read()
-				self._logger.warning('  Issue with sent HTTP request (%s) returned: %s', GetRequest, resp_data)
-		except httplib.NotConnected:
-			self._logger.error('  Thermostat not connected to the HTTP destination %s - data not transmitted', self._db_address)
-		except httplib.HTTPException as err:
-			self._logger.error('  Received HTTP error - %s - data not transmitted', str(err))
-		except socket.error as serr:
-			self._logger.error('  Received socket error - %s - data not transmitted', str(serr))
-		finally:
-			httpconn.close()  # Close the http connection
+		with self._http_lock:
+			try:
+				try:
+					reason, resp_data = self._http_get(GetRequest)
+				except (http.client.BadStatusLine, http.client.CannotSendRequest, BrokenPipeError, ConnectionResetError) as err:
+					# The server may have dropped the idle connection, so reconnect and retry once
+					# - not on a timeout, as the request may have been received and would be inserted twice
+					self._logger.debug('    HTTP connection lost - %s - reconnecting', str(err))
+					self._httpconn.close()
+					reason, resp_data = self._http_get(GetRequest)
+
+				# Process the response
+				if reason == "OK":
+					self._logger.debug('    LAN HTTP response received: OK')
+					success = True
+				else:
+					self._logger.warning('  Issue with sent HTTP request (%s) returned: %s', GetRequest, resp_data)
+			except http.client.NotConnected:
+				self._logger.error('  Thermostat not connected to the HTTP destination %s - data not transmitted', self._db_address)
+			except http.client.HTTPException as err:
+				self._httpconn.close()  # Start with a fresh connection next time
+				self._logger.error('  Received HTTP error - %s - data not transmitted', str(err))
+			except socket.error as serr:
+				self._httpconn.close()  # Start with a fresh connection next time
+				self._logger.error('  Received socket error - %s - data not transmitted', str(serr))
 
 		return success
+
+	#---------------------------------------------------------------------------
+	# _http_get Method
+	#---------------------------------------------------------------------------
+	def _http_get(self, GetRequest):
+		# types: (string) -> (string, string)
+		# Send the request and read the whole response, which is needed before the connection can be reused
+		self._httpconn.request('GET', GetRequest)
+		httpresp = self._httpconn.getresponse()
+		return httpresp.reason, httpresp.read()
 		
 	#---------------------------------------------------------------------------
 	# send_socket_request Method
@@ -234,15 +398,21 @@ class LANNetwork(threading.Thread):
 		client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 		client.settimeout(3)  # Set a timeout of 3 seconds for directly over a socket
 		success = True  # Assume the socket write is fine
+		connected = False
 		try:
 			# Connect to the socket and send the data
 			client.connect((DPacket.host, int(DPacket.port)))
-			client.send(DPacket.packet)
-		except socket.error as err:
+			connected = True
+			client.send(DPacket.packet.encode())
+		except (socket.error, ValueError) as err:
 			self._logger.error('  Thermostat socket error writing to %s:%s - %s - data not transmitted', DPacket.host, DPacket.port, str(err))
 			success = False
 		finally:
-			client.shutdown(socket.SHUT_RDWR)
+			if connected:	# Only a connected socket can be shut down
+				try:
+					client.shutdown(socket.SHUT_RDWR)
+				except socket.error:
+					pass	# The other end already closed
 			client.close()
 		
 		return success
@@ -27,6 +27,9 @@
 # REVISION HISTORY
 #
 
+# Imports
+import binascii
+
 #===============================================================================
 # CONSTANTS
 #===============================================================================
@@ -36,6 +39,7 @@ XBEE_TX_MESSAGE		=  1
 THERMO_TX_MESSAGE	=  2
 LAN_TX_MESSAGE		=  3
 DISPLAY_TX_MESSAGE	=  4
+DISPLAY_TX_BATCH	=  5
 
 
 #===============================================================================
@@ -53,11 +57,11 @@ def binary_print(bin_data, separator = '-'):
 	:param	bin_data:
 	:param  separator:
 	"""
-	output = ''	# Empty string
-	for byte in bin_data:
-		output += '%02x%s' % ( ord(byte), separator )
+	hex_data = binascii.hexlify(bin_data).decode()	# Converted in a single pass
+	if not separator:
+		return hex_data
 
-	return output if separator == '' else output[0:-1]
+	return separator.join([ hex_data[i:i+2] for i in range(0, len(hex_data), 2) ])
 
 
 #===============================================================================
@@ -65,6 +69,8 @@ def binary_print(bin_data, separator = '-'):
 #===============================================================================
 # Basic class that handles simple messages with associated data
 class Message(object):
+	__slots__ = ('_id', '_data')
+
 	#---------------------------------------------------------------------------
 	# Constructor
 	#---------------------------------------------------------------------------
@@ -103,6 +109,8 @@ class Message(object):
 # Class for handling messages going to the thermostat.  These would contain
 # commands from a socket.
 class ThermostatTxMessage(Message):
+	__slots__ = ()
+
 	#---------------------------------------------------------------------------
 	# Constructor
 	#---------------------------------------------------------------------------
@@ -116,22 +124,36 @@ class ThermostatTxMessage(Message):
 # Command Class
 #===============================================================================
 # Simple class containing a command, possible command type (subcommand), and
-# possibly associated data for the command
+# possibly associated data for the command.  The fields are read-only, so the
+# formatted string can be kept once built.
 class Command(object):
+	__slots__ = ('_command', '_subcommand', '_data', '_str')
+
 	#---------------------------------------------------------------------------
 	# Constructor
 	#---------------------------------------------------------------------------
 	def __init__(self, Cmd, SubCmd, CmdData):
 		# types: (int, int, list) -> none
-		self.command = Cmd
-		self.subcommand = SubCmd
-		self.data = CmdData
+		self._command = Cmd
+		self._subcommand = SubCmd
+		self._data = CmdData
+		self._str = None	# Formatted on first use
+
+	#---------------------------------------------------------------------------
+	# Read-only fields
+	#---------------------------------------------------------------------------
+	command = property(lambda self: self._command)
+	subcommand = property(lambda self: self._subcommand)
+	data = property(lambda self: self._data)
 
 	#---------------------------------------------------------------------------
 	# __str__ Override
 	#---------------------------------------------------------------------------
 	def __str__(self):
-		return '(%i, %i, %i)' % ( self.command, self.subcommand, self.data )
+		# The subcommand and data can be None or floats, so format generally
+		if self._str is None:
+			self._str = '(%i, %s, %s)' % ( self._command, self._subcommand, self._data )
+		return self._str
 
 
 #===============================================================================
@@ -145,6 +167,8 @@ class Command(object):
 #	port	:	The port to connect to at the host
 #	packet	:	The data packet to be transferred
 class DataPacket(object):
+	__slots__ = ('host', 'port', 'packet')
+
 	#---------------------------------------------------------------------------
 	# Constructor
 	#---------------------------------------------------------------------------
@@ -166,6 +190,8 @@ class DataPacket(object):
 # Class inheriting DataPacket meant for the database - the host and port members
 # are null
 class DBPacket(DataPacket):
+	__slots__ = ()
+
 	#---------------------------------------------------------------------------
 	# Constructor
 	#---------------------------------------------------------------------------
@@ -179,6 +205,8 @@ class DBPacket(DataPacket):
 # Class inheriting DataPacket meant for the display - the host and port members
 # are set to the string DISPLAY
 class DisplayPacket(DataPacket):
+	__slots__ = ()
+
 	#---------------------------------------------------------------------------
 	# Constructor
 	#---------------------------------------------------------------------------
@@ -192,6 +220,8 @@ class DisplayPacket(DataPacket):
 # Class for contains messages going to the LAN.  These could either be for the
 # the database (no host/port specified) or as a reply to a socket command.
 class LANTxMessage(Message):
+	__slots__ = ()
+
 	#---------------------------------------------------------------------------
 	# Constructor
 	#---------------------------------------------------------------------------
@@ -219,6 +249,8 @@ class LANTxMessage(Message):
 #===============================================================================
 # Class for contains messages going to the 4D display.
 class DisplayTxMessage(Message):
+	__slots__ = ()
+
 	#---------------------------------------------------------------------------
 	# Constructor
 	#---------------------------------------------------------------------------
@@ -226,3 +258,19 @@ class DisplayTxMessage(Message):
 		# types: (Command) -> none
 		# Initialize members - TODO To CHECK FOR DataPacket TYPE
 		Message.__init__(self, DISPLAY_TX_MESSAGE, DisplayPacket(command))
+
+
+#===============================================================================
+# DisplayTxBatch Class
+#===============================================================================
+# Class for contains a list of commands going to the 4D display together, which
+# are processed in order.
+class DisplayTxBatch(Message):
+	__slots__ = ()
+
+	#---------------------------------------------------------------------------
+	# Constructor
+	#---------------------------------------------------------------------------
+	def __init__(self, commands):
+		# types: (list) -> none
+		Message.__init__(self, DISPLAY_TX_BATCH, DisplayPacket(commands))
@@ -1,4 +1,4 @@
-#!/usr/bin/python
+#!/usr/bin/python3
 # 
 # Imports
 import xbee_network
@@ -6,18 +6,24 @@ import messaging
 import thermostat
 import lan_network
 import display
-import Queue
+import collections
+import queue
 import logging.config
+import logging.handlers
 import threading
 import argparse
 import yaml
+try:
+	from yaml import CSafeLoader as ConfigLoader  # libyaml bindings, if they were built
+except ImportError:
+	from yaml import SafeLoader as ConfigLoader
 from time import sleep
 
 # ===============================================================================
 # CONSTANTS
 # ===============================================================================
 # Timing
-MESSAGE_DELAY = 0.001  # The delay between checking for new messages
+MESSAGE_TIMEOUT = 0.5  # The longest wait for a new message before checking for shutdown
 NORM_CONTROL_INTERVAL = 10  # Number of sensor cycles for sensor data output
 DEBUG_CONTROL_INTERVAL = 3  # As above for debugging
 NORM_SENSOR_DELAY = 60  # Time in seconds between thermostat temperature readings
@@ -30,9 +36,12 @@ DEBUG_DB_UPLOAD = '/db_test_upload.php?'
 # ===============================================================================
 # GLOBAL VARIABLES
 # ===============================================================================
-message_list = Queue.Queue()
+message_list = collections.deque()
+message_ready = threading.Condition()  # Signals the main loop that messages are waiting
 shutdown = threading.Event()
 config = None  # Contains the settings read from the config file
+debug_logging = False  # Indicates if debug messages are being logged
+log_listeners = []  # The listeners writing queued log records out to the configured handlers
 
 # ===============================================================================
 # FUNCTIONS
@@ -42,46 +51,80 @@ config = None  # Contains the settings read from the config file
 # -------------------------------------------------------------------------------
 def queue_message(in_msg):
 	if isinstance(in_msg, messaging.Message):
-		# Add to the message list
-		message_list.put(in_msg)
+		# Add to the message list and wake the main loop
+		with message_ready:
+			message_list.append(in_msg)
+			message_ready.notify()
 	else:
 		logger.warning('Wrong type (%s) sent to queue, message will be ignored', type(in_msg))
 
 # -------------------------------------------------------------------------------
-# dispatch_message Function
+# send_xbee Function
 # -------------------------------------------------------------------------------
-def dispatch_message(cur_msg):
-	# types: (string) -> None
-	# Determine the type of message received
-	msg_id = cur_msg.get_id()
-
-	if msg_id == messaging.XBEE_TX_MESSAGE:  # Transmit command to XBees
-		pass  # For future functionality, but not needed now
+def send_xbee(cur_msg):
+	pass  # For future functionality, but not needed now
 
-	elif msg_id == messaging.THERMO_TX_MESSAGE:  # Transmit thermostat command
+# -------------------------------------------------------------------------------
+# send_thermostat Function
+# -------------------------------------------------------------------------------
+def send_thermostat(cur_msg):
+	if debug_logging:
 		logger.debug('  Sending Thermostat transmission request, forwarding to the Thermostat')
-		thermo_thread.process_command(cur_msg.get_data())
-
-	elif msg_id == messaging.LAN_TX_MESSAGE:  # Send a message over the LAN
-		# Send message over the LAN
-		logger.debug('  Received LAN transmission request for %s', 'database' if cur_msg.is_http() else 'socket')
-		if cur_msg.is_http():  # Database message via http
-			logger.info('Sending LAN transmission request via HTTP')
-			lan_success = lan_thread.send_http_request(cur_msg.get_data().packet)
-		else:
-			logger.info('Sending LAN transmission response via a socket')
-			lan_success = lan_thread.send_socket_request(cur_msg.get_data())
-
-		# Process any errors
-		if not lan_success:
-			pass  # TODO - resubmit the message to try again?
-
-	elif msg_id == messaging.DISPLAY_TX_MESSAGE:  # Transmitting message to the display
-		# Send message to the display
-		display_thread.process_message(cur_msg.get_data())
+	thermo_thread.process_command(cur_msg.get_data())
+
+# -------------------------------------------------------------------------------
+# send_lan Function
+# -------------------------------------------------------------------------------
+def send_lan(cur_msg):
+	# Send message over the LAN
+	is_http = cur_msg.is_http()
+	if debug_logging:
+		logger.debug('  Received LAN transmission request for %s', 'database' if is_http else 'socket')
+	if is_http:  # Database message via http
+		logger.info('Queueing LAN transmission request via HTTP')
+		lan_thread.queue_http_request(cur_msg.get_data().packet)
+		lan_success = True  # Sent on the LAN HTTP thread, which logs any failure
+	else:
+		logger.info('Sending LAN transmission response via a socket')
+		lan_success = lan_thread.send_socket_request(cur_msg.get_data())
+
+	# Process any errors
+	if not lan_success:
+		pass  # TODO - resubmit the message to try again?
+
+# -------------------------------------------------------------------------------
+# send_display Function
+# -------------------------------------------------------------------------------
+def send_display(cur_msg):
+	# Send message to the display
+	display_thread.process_message(cur_msg.get_data())
+
+# -------------------------------------------------------------------------------
+# send_display_batch Function
+# -------------------------------------------------------------------------------
+def send_display_batch(cur_msg):
+	# Send the list of commands to the display in one go
+	display_thread.process_batch(cur_msg.get_data())
+
+# Map each message type to the function that sends it on
+MESSAGE_HANDLERS = {
+	messaging.XBEE_TX_MESSAGE: send_xbee,
+	messaging.THERMO_TX_MESSAGE: send_thermostat,
+	messaging.LAN_TX_MESSAGE: send_lan,
+	messaging.DISPLAY_TX_MESSAGE: send_display,
+	messaging.DISPLAY_TX_BATCH: send_display_batch }
 
+# -------------------------------------------------------------------------------
+# dispatch_message Function
+# -------------------------------------------------------------------------------
+def dispatch_message(cur_msg):
+	# types: (Message) -> None
+	# Determine the type of message received and pass it on
+	handler = MESSAGE_HANDLERS.get(cur_msg.get_id())
+	if handler:
+		handler(cur_msg)
 	else:  # Something not expected
-		logger.warning('Message queue contains unknown message type: %i', msg_id.get_id())
+		logger.warning('Message queue contains unknown message type: %i', cur_msg.get_id())
 
 
 # ===============================================================================
@@ -105,12 +148,22 @@ else:
 	logging.config.fileConfig('/home/tl1/.thermopi.logger.debug.conf')
 logger = logging.getLogger('MAIN')
 
+# Move the configured handlers behind queues, so the file writes happen on the listener threads
+for cur_logger in (logging.getLogger(), logger):
+	if cur_logger.handlers:
+		log_queue = queue.Queue()
+		log_listeners.append(logging.handlers.QueueListener(log_queue, *cur_logger.handlers, respect_handler_level=True))
+		cur_logger.handlers = [ logging.handlers.QueueHandler(log_queue) ]
+for cur_listener in log_listeners:
+	cur_listener.start()
+debug_logging = logger.isEnabledFor(logging.DEBUG)  # The level is fixed by the config file, so check it once
+
 logger.info('Starting up the program in %s mode.', 'Normal' if args.mode == 'NORMAL' else 'Debug')
 
 # Read in the configuration file
 config_file = '/home/tl1/.thermopi.conf' if args.mode == 'NORMAL' else '/home/tl1/.thermopi.debug.conf'
 with open(config_file, 'r') as ymlfile:
-	config = yaml.load(ymlfile)
+	config = yaml.load(ymlfile, Loader=ConfigLoader)
 
 # Start the display
 display_thread = display.DisplayControl(queue_message, shutdown)
@@ -131,20 +184,38 @@ lan_thread.start()
 xbee_thread = xbee_network.XBeeNetwork(queue_message, shutdown, db_upload_string, config['outdoor_radio'])
 xbee_thread.start()
 
-# Loop to check the status of the queue and dispatch messages
-while not shutdown.is_set():
-	if not message_list.empty():
-		dispatch_message(message_list.get())
-	shutdown.wait(MESSAGE_DELAY)
+# Loop to check the status of the queue and dispatch messages - bind the names used every pass up front
+is_shutdown = shutdown.is_set
+wait_messages = message_ready.wait
+clear_messages = message_list.clear
+dispatch = dispatch_message
+while not is_shutdown():
+	# Wait for messages, and take everything that queued up in one go
+	with message_ready:
+		if not message_list:
+			wait_messages(MESSAGE_TIMEOUT)
+		batch = list(message_list)
+		clear_messages()
+
+	# Dispatch outside the lock so the other threads can keep queueing
+	for cur_msg in batch:
+		dispatch(cur_msg)
 
 # Wait for threads to finish
+lan_thread.stop()
+thermo_thread.stop()
+display_thread.stop()
 lan_thread.join()
 xbee_thread.join()
 thermo_thread.join()
 display_thread.join()
 
 # Display any remaining items
-logger.info('Program closed with %i items in the queue', message_list.qsize())
-while not message_list.empty():
-	cur_message = message_list.get()
+logger.info('Program closed with %i items in the queue', len(message_list))
+while message_list:
+	cur_message = message_list.popleft()
 	logger.info('  Message unprocessed: %s', cur_message.to_string())
+
+# Write out anything still queued for the log
+for cur_listener in log_listeners:
+	cur_listener.stop()
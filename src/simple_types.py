@@ -22,15 +22,27 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+# Rule Days
+MONDAY		= 0
+TUESDAY		= 1
+WEDNESDAY	= 2
+THURSDAY	= 3
+FRIDAY		= 4
+SATURDAY	= 5
+SUNDAY		= 6
+WEEKDAYS	= 7
+WEEKENDS	= 8
+EVERYDAY	= 9
+
 # Rules
 RULE_DAYS = {
-	'Monday': 0,
-	'Tuesday': 1,
-	'Wednesday': 2,
-	'Thursday': 3,
-	'Friday': 4,
-	'Saturday': 5,
-	'Sunday': 6,
-	'Weekdays': 7,
-	'Weekends': 8,
-	'Everyday': 9 }
+	'Monday': MONDAY,
+	'Tuesday': TUESDAY,
+	'Wednesday': WEDNESDAY,
+	'Thursday': THURSDAY,
+	'Friday': FRIDAY,
+	'Saturday': SATURDAY,
+	'Sunday': SUNDAY,
+	'Weekdays': WEEKDAYS,
+	'Weekends': WEEKENDS,
+	'Everyday': EVERYDAY }
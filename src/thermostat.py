@@ -28,15 +28,17 @@
 
 # Imports
 import logging
+import collections
 import messaging
 import pigpio
 import threading
+import queue
 import time
+import bisect
 import display
 #from tsl2561 import TSL2561
 from htu21d import HTU21D
-from datetime import datetime
-from simple_types import RULE_DAYS
+from simple_types import RULE_DAYS, MONDAY, SUNDAY, WEEKDAYS, WEEKENDS, EVERYDAY
 
 #===============================================================================
 # Constants
@@ -74,6 +76,21 @@ MAX_TEMPERATURE 	= 25.0	# Above this temperature, the relay closes no matter the
 TEMPERATURE_BUFFER	=  0.15	# The buffer to apply in the thermostat set target in evaluation relay
 ABSOLUTE_ZERO       = -273.0  # Default value for temperature that would signal no data
 
+# Control timing
+STABLE_TEMPERATURE	= TEMPERATURE_BUFFER/4	# Largest change between cycles that counts as a steady temperature
+MAX_BACKOFF_SHIFT	=  2	# Steady cycles stretch the control period by up to 2**MAX_BACKOFF_SHIFT
+
+SHUTDOWN_DELAY		=  1.0	# Seconds between acknowledging a shutdown command and ending the threads
+
+# Display updates
+DISPLAY_TEMP_CHANGE	=  0.15	# Change from the displayed temperature needed to update it, above the 0.05 rounding step
+
+# Programming rule in the weekly schedule - start is in seconds past midnight on Monday
+Rule = collections.namedtuple('Rule', 'start temperature')
+SECONDS_PER_DAY		= 24*60*60
+SECONDS_PER_WEEK	= 7*SECONDS_PER_DAY
+RULE_DAY_MASKS		= { EVERYDAY: 0x7F, WEEKDAYS: 0x1F, WEEKENDS: 0x60 }	# Weekday bits for the day groups, single days are 1 << day
+
 # GPIO Pins
 THERMO_POWER_PIN	= 21
 RELAY_POWER_PIN		= 16
@@ -93,8 +110,22 @@ POWER_SWITCH_PIN	= 12
 #	_override_on	:	Boolean indicating if in override mode or not
 #	_setpoint		:	Current temperature setpoint
 #	_temperature	:	Last measured temperature
+#	_display_temp	:	The measured temperature last written to the display
+#	_display_setpoint:	The setpoint last formatted for the display
+#	_temp_time		:	Monotonic time of the last temperature reading, None before the first
+#	_humidity		:	Last measured humidity
+#	_humidity_time	:	Monotonic time of the last humidity reading, None before the first
 #	_gpio_bus		:	The instance of the GPIO bus access
-#	_rules			:	An structure containing the thermostat rules
+#	_rule_timeline	:	The Rule entries for the whole week, in order of start
+#	_rule_starts	:	The start of each entry in _rule_timeline, for searching
+#	_last_db_state	:	The rounded values in the last database update, to skip periodic updates with no news
+#	_pending_display:	The display updates from the current operation, keyed by target, waiting to be sent
+#	_status_cmds	:	Prebuilt display commands for the fixed indicator states, keyed by (target, value)
+#	_inbox			:	Queue of commands for the thermostat thread, None only wakes it to check for shutdown
+#	_db_deadline	:	Monotonic time the next forced database update is due
+#	_stable_count	:	The number of control cycles in a row with a steady temperature, up to MAX_BACKOFF_SHIFT
+#	_shutdown_deadline:	Monotonic time to set the kill event after a shutdown command, None if none requested
+#	_debug_logging	:	Indicates if debug messages are being logged
 #	_kill_event		:	An event that signals that the thread is to end
 #
 class Thermostat(threading.Thread):
@@ -108,17 +139,45 @@ class Thermostat(threading.Thread):
 		self._data_cycles = data_cycles
 		self._setpoint = 0.0	# Dummy value for startup
 		self._setpoint_str = ''
+		self._display_setpoint = None	# The setpoint behind _setpoint_str, None until first shown
 		self._outdoor_temp_str = ''
 		self._indoor_temp_str = ''
+		self._display_temp = None	# The temperature behind _indoor_temp_str, None until first shown
 		self._override_on = False
 		self._override_temp = 15.0  # Dummy to set the indicator at the bottom of the scale
-		self._qbase = query_base
+		self._qprefix = '%sradio_id=%s' % ( query_base, user_config['thermo_radio'] )	# Fixed start of every database query
 		self._thermo_on = False  # Set so first call to _set_thermo_status turns on the thermostat
 		self._relay_on = True  # Set so first call to _set_relay_status turns off the relay
 		self._user_config = user_config
+		self._temperature = ABSOLUTE_ZERO
+		self._temp_time = None
+		self._humidity = 0.0
+		self._humidity_time = None
+		self._inbox = queue.Queue()
+		self._db_deadline = 0.0	# Set so the first control cycle forces an update
+		self._last_db_state = None
+		self._pending_display = {}
+		self._shutdown_deadline = None
+		self._stable_count = 0
 
 		# Initialize logger
 		self._logger = logging.getLogger('MAIN.THERMO')
+		self._debug_logging = self._logger.isEnabledFor(logging.DEBUG)	# The level is fixed by the config file, so check it once
+
+		# Build the display commands for the LEDs and buttons once, as they only ever take these values
+		self._status_cmds = {}
+		for target, values in ( (display.POWER_LED, (display.LED_ON, display.LED_OFF)),
+								(display.RELAY_LED, (display.LED_ON, display.LED_OFF)),
+								(display.PROGRAM_BTN, (display.BTN_ON, display.BTN_OFF)),
+								(display.OVER_BTN, (display.BTN_ON, display.BTN_OFF)) ):
+			for value in values:
+				self._status_cmds[(target, value)] = messaging.Command(display.SET_STATUS, target, value)
+
+		# Expand the programming rules into a schedule for the week
+		self._rule_timeline = self._build_rule_timeline(user_config['programming_rules'])
+		self._rule_starts = [ rule.start for rule in self._rule_timeline ]
+		if not self._rule_timeline:
+			self._logger.warning('No programming rules defined - the relay will only follow the temperature limits and override')
 
 		# Initialize the gpio
 		self._gpio_bus = pigpio.pi()
@@ -147,35 +206,117 @@ class Thermostat(threading.Thread):
 		self._set_relay_status(RELAY_OFF)
 
 		# Initialize the settings on the display
-		self._ehandler(messaging.DisplayTxMessage(messaging.Command(display.SET_STATUS, display.POWER_LED, display.LED_ON)))
-		self._ehandler(messaging.DisplayTxMessage(messaging.Command(display.SET_STATUS, display.OVER_BTN, display.BTN_OFF)))
-		self._ehandler(messaging.DisplayTxMessage(messaging.Command(display.SET_STATUS, display.OVER_SCALE, self._override_temp)))
-
-		# Loop until time to close
-		non_printing_loops = self._data_cycles
-		while not self._kill_event.is_set():
-			self._logger.info('Thermostat control cycle %i of %i initiated', non_printing_loops, self._data_cycles)
-			# Evaluate thermostat programming
-			force_print = False
-			if non_printing_loops == self._data_cycles:
-				non_printing_loops = 1
-				force_print = True
+		self._send_display(display.POWER_LED, display.LED_ON)
+		self._send_display(display.OVER_BTN, display.BTN_OFF)
+		self._send_display(display.OVER_SCALE, self._override_temp)
+
+		# Handle commands as they arrive, and run a control cycle whenever a sensor period passes without one
+		# - everything runs on this thread, so the state needs no locking
+		# - cycles are scheduled from the previous deadline, so the time spent in each cycle does not add up
+		# - the names used on every pass are bound once up front
+		is_killed = self._kill_event.is_set
+		get_packet = self._inbox.get
+		monotonic = time.monotonic
+		handle_tick = self._handle_tick
+		handle_command = self._handle_command
+		flush_display = self._flush_display
+		sensor_period = self._sensor_period
+		next_tick = monotonic()
+		schedule_tick = self._schedule_tick
+		handle_tick()
+		flush_display()
+		next_tick = schedule_tick(next_tick)
+		while not is_killed():
+			wake_time = next_tick if self._shutdown_deadline is None else self._shutdown_deadline	# No more control cycles once shutting down
+			try:
+				Packet = get_packet(timeout=max(wake_time - monotonic(), 0))
+			except queue.Empty:
+				if self._shutdown_deadline is not None:
+					if monotonic() >= self._shutdown_deadline:
+						self._kill_event.set()	# Signal all the threads to end
+					continue	# The thermostat is already off, so no more control cycles
+				handle_tick()
+				flush_display()
+				next_tick = schedule_tick(next_tick)
+				now = monotonic()
+				if next_tick < now:	# Fell a whole period behind, so restart the schedule rather than run cycles back to back
+					next_tick = now
 			else:
-				non_printing_loops += 1
-			self._evaluate_programming(force_print)
-			
-			# Wait until next control cycle
-			self._kill_event.wait(self._sensor_period)
-
-		# Shutdown the GPIO bus
+				if Packet is not None:
+					# A command may change the heating, so go back to the normal control period
+					self._stable_count = 0
+					next_tick = min(next_tick, monotonic() + sensor_period)
+					handle_command(Packet)
+					flush_display()
+
+		# Shutdown the sensor and the GPIO bus
+		self._temp_sensor.close()
 		self._gpio_bus.stop()
 		
 		self._logger.debug('Thermostat thread closing')
 
+	#---------------------------------------------------------------------------
+	# stop Method
+	#---------------------------------------------------------------------------
+	def stop(self):
+		# types: () -> none
+		# Wake the thread so it sees the kill event without waiting out the sensor period
+		self._inbox.put(None)
+
 	#---------------------------------------------------------------------------
 	# process_command Method
 	#---------------------------------------------------------------------------
 	def process_command(self, Packet):
+		# types: (DataPacket) -> none
+		# Hand off to the thermostat thread, which processes commands in order between control cycles
+		self._inbox.put(Packet)
+
+	#---------------------------------------------------------------------------
+	# _handle_tick Method
+	#---------------------------------------------------------------------------
+	def _handle_tick(self):
+		# types: () -> none
+		# Evaluate thermostat programming, forcing a database update every data_cycles sensor periods
+		# - timed on the clock rather than by counting cycles, as steady cycles are stretched
+		self._logger.info('Thermostat control cycle initiated')
+		now = time.monotonic()
+		force_print = now >= self._db_deadline - 0.5*self._sensor_period	# Allow for ticks landing just short of the deadline
+		if force_print:
+			self._db_deadline += self._data_cycles*self._sensor_period
+			if self._db_deadline <= now:	# First update, or fell behind, so restart the schedule
+				self._db_deadline = now + self._data_cycles*self._sensor_period
+		prev_temp, prev_time, prev_relay = self._temperature, self._temp_time, self._relay_on
+		self._evaluate_programming(force_print, time.localtime())	# One clock reading serves the whole cycle
+
+		# Back off the control period while new readings hold steady and the relay stays put
+		if self._temp_time != prev_time and self._relay_on == prev_relay and abs(self._temperature - prev_temp) < STABLE_TEMPERATURE:
+			self._stable_count = min(self._stable_count + 1, MAX_BACKOFF_SHIFT)
+		else:
+			self._stable_count = 0
+
+	#---------------------------------------------------------------------------
+	# _schedule_tick Method
+	#---------------------------------------------------------------------------
+	def _schedule_tick(self, last_tick):
+		# types: (float) -> float
+		# The control period stretches while the temperature holds steady, but never past the next forced database update
+		# or programmed rule change, as those are only acted on in a control cycle
+		next_tick = last_tick + self._sensor_period*(1 << self._stable_count)
+		if not self._stable_count:
+			return next_tick
+		next_tick = min(next_tick, self._db_deadline)
+		if self._rule_starts:
+			cur_time = time.localtime()
+			cur_secs = SECONDS_PER_DAY*cur_time.tm_wday + 3600*cur_time.tm_hour + 60*cur_time.tm_min + cur_time.tm_sec
+			index = bisect.bisect_right(self._rule_starts, cur_secs)
+			change = self._rule_starts[index] if index < len(self._rule_starts) else self._rule_starts[0] + SECONDS_PER_WEEK
+			next_tick = min(next_tick, time.monotonic() + change - cur_secs + 1)	# A second late, so the new rule has started
+		return next_tick
+
+	#---------------------------------------------------------------------------
+	# _handle_command Method
+	#---------------------------------------------------------------------------
+	def _handle_command(self, Packet):
 		# types: (DataPacket) -> none
 		# Check that the passed type is correct
 		self._logger.info('Thermostat received command and initiating processing')
@@ -204,12 +345,8 @@ class Thermostat(threading.Thread):
 				self._force_shutdown()
 				response = messaging.DataPacket(Packet.host, Packet.port, 'XX:ACK')
 
-				# Set timer with delay and then set the kill event
-				def signal_kill():
-					self._kill_event.set()
-
-				kill_timer = threading.Timer(1, signal_kill)  # 1 second delay
-				kill_timer.start()
+				# Set the kill event from the main loop after a delay, so the response has time to go out
+				self._shutdown_deadline = time.monotonic() + SHUTDOWN_DELAY
 			else:
 				self._logger.warning('  Unknown type of command received: %i - ignoring command', Packet.packet.command)
 				send_response = False
@@ -228,11 +365,8 @@ class Thermostat(threading.Thread):
 		# types: (DataPacket) -> DataPacket
 		# Check the command type
 		if dpack.packet.subcommand == STATUS_GET:
-			# Get the current date and time
-			cur_dt = datetime.now()
-			
-			# Create the response string
-			resp_str = 'CR:GET:%i:%i:%i:%i:%i:%i:%i' % (cur_dt.year, cur_dt.month, cur_dt.day, cur_dt.weekday(), cur_dt.hour, cur_dt.minute, cur_dt.second)
+			# Create the response string from the current date and time
+			resp_str = self._format_clock(time.localtime())
 		else:
 			self._logger.critical('  Unknown clock control made it to the thermostat - THIS SHOULD NOT HAPPEN')
 			return messaging.DataPacket(dpack.host, dpack.port, 'CR:NACK')
@@ -240,6 +374,15 @@ class Thermostat(threading.Thread):
 		# Return the acknowledgement/data
 		return messaging.DataPacket(dpack.host, dpack.port, resp_str)
 			
+	#---------------------------------------------------------------------------
+	# _format_clock Method
+	#---------------------------------------------------------------------------
+	@staticmethod
+	def _format_clock(cur_dt):
+		# types: (struct_time) -> string
+		# Clock response with the date, weekday and time fields
+		return 'CR:GET:%i:%i:%i:%i:%i:%i:%i' % ( cur_dt.tm_year, cur_dt.tm_mon, cur_dt.tm_mday, cur_dt.tm_wday, cur_dt.tm_hour, cur_dt.tm_min, cur_dt.tm_sec )
+
 	#---------------------------------------------------------------------------
 	# _update_thermo_status Method
 	#---------------------------------------------------------------------------
@@ -256,7 +399,7 @@ class Thermostat(threading.Thread):
 			self._logger.info('  Thermostat is turning off')
 			self._set_thermo_status(THERMOSTAT_OFF)
 			self._set_relay_status(RELAY_ON)
-			self._update_database()
+			self._update_database(self._temperature)	# The last measured temperature is recent enough
 		
 		# Return an acknowledgement
 		return messaging.DataPacket(dpack.host, dpack.port, 'TS:ACK')
@@ -268,8 +411,8 @@ class Thermostat(threading.Thread):
 		# Shutdown the thermostat
 		self._set_thermo_status(THERMOSTAT_OFF)
 		self._set_relay_status(RELAY_ON)
-		self._update_database()
-		self._ehandler(messaging.DisplayTxMessage(messaging.Command(display.SET_STATUS, display.POWER_LED, display.LED_OFF)))
+		self._update_database(self._temperature)	# The last measured temperature is recent enough
+		self._send_display(display.POWER_LED, display.LED_OFF)
 
 	#---------------------------------------------------------------------------
 	# _update_override Method
@@ -297,8 +440,8 @@ class Thermostat(threading.Thread):
 
 			# Update the display if command was from the LAN
 			if dpack.host != 'DISPLAY':
-				self._ehandler(messaging.DisplayTxMessage(messaging.Command(display.SET_STATUS, display.OVER_BTN, button_status)))
-				self._ehandler(messaging.DisplayTxMessage(messaging.Command(display.SET_STATUS, display.OVER_SCALE, self._override_temp)))
+				self._send_display(display.OVER_BTN, button_status)
+				self._send_display(display.OVER_SCALE, self._override_temp)
 
 			# Re-evaluation relay status against the setpoint
 			self._evaluate_programming(True)	# Force an update based on status
@@ -312,13 +455,12 @@ class Thermostat(threading.Thread):
 	#---------------------------------------------------------------------------
 	def _return_status(self, dpack):
 		# types: (DataPacket) -> DataPacket
-		# Create the response string
-		resp_str = 'ST:'	# Status data identifier
-		resp_str += 'ON:' if self._thermo_on else 'OFF:'	# Status of the thermostat power 
-		resp_str += 'ON:' if self._relay_on else 'OFF:'		# Status of the relay
-		resp_str += '%.2f:' % self._temperature			    # Last measured temperature
-		resp_str += '%.2f:' % self._setpoint			    # Return the current temperature setpoint
-		resp_str += 'ON' if self._override_on else 'OFF'	# Return status of the override
+		# Create the response string - power, relay, last measured temperature, current setpoint and override
+		resp_str = 'ST:%s:%s:%.2f:%.2f:%s' % ( 'ON' if self._thermo_on else 'OFF',
+											   'ON' if self._relay_on else 'OFF',
+											   self._temperature,
+											   self._setpoint,
+											   'ON' if self._override_on else 'OFF' )
 		
 		# Create and return the response data packet
 		return messaging.DataPacket(dpack.host, dpack.port, resp_str)
@@ -331,16 +473,16 @@ class Thermostat(threading.Thread):
 		# Check to see if anything needs to change
 		if self._thermo_on != PowerStatus:
 			# Update object status
-			self._logger.info('    Turning thermostat %s', 'on' if PowerStatus == THERMOSTAT_ON else 'off')
+			self._logger.info('    Turning thermostat %s', 'on' if PowerStatus else 'off')
 			self._thermo_on = PowerStatus
 
 			# Update the power indicators
-			if PowerStatus == THERMOSTAT_ON:	# Turn on the LED
+			if PowerStatus:	# Turn on the LED
 #				self._gpio_bus.write(THERMO_POWER_PIN, 1)	# Power up the button
-				self._ehandler(messaging.DisplayTxMessage(messaging.Command(display.SET_STATUS, display.PROGRAM_BTN, display.BTN_ON)))
+				self._send_display(display.PROGRAM_BTN, display.BTN_ON)
 			else:	# Turn off the LED
 #				self._gpio_bus.write(THERMO_POWER_PIN, 0)	# Power down the button
-				self._ehandler(messaging.DisplayTxMessage(messaging.Command(display.SET_STATUS, display.PROGRAM_BTN, display.BTN_OFF)))
+				self._send_display(display.PROGRAM_BTN, display.BTN_OFF)
 
 	#---------------------------------------------------------------------------
 	# _set_relay_status Method
@@ -354,186 +496,239 @@ class Thermostat(threading.Thread):
 			self._relay_on = RelayStatus
 
 			# Update the power indicators
-			if RelayStatus == RELAY_ON:	# Close relay to turn on heat
+			if RelayStatus:	# Close relay to turn on heat
 #				self._gpio_bus.write(RELAY_STATUS_PIN, 1)
 				self._gpio_bus.write(RELAY_POWER_PIN, 0)
-				self._ehandler(messaging.DisplayTxMessage(messaging.Command(display.SET_STATUS, display.RELAY_LED, display.LED_ON)))
+				self._send_display(display.RELAY_LED, display.LED_ON)
 			else:	# Open relay to turn off heat
 #				self._gpio_bus.write(RELAY_STATUS_PIN, 0)
 				self._gpio_bus.write(RELAY_POWER_PIN, 1)
-				self._ehandler(messaging.DisplayTxMessage(messaging.Command(display.SET_STATUS, display.RELAY_LED, display.LED_OFF)))
+				self._send_display(display.RELAY_LED, display.LED_OFF)
+
+	#---------------------------------------------------------------------------
+	# _send_display Method
+	#---------------------------------------------------------------------------
+	def _send_display(self, target, value):
+		# types: (int, object) -> none
+		# Hold the update until the current operation is done, so only the final value for each target is sent
+		self._pending_display[target] = value
+
+	#---------------------------------------------------------------------------
+	# _flush_display Method
+	#---------------------------------------------------------------------------
+	def _flush_display(self):
+		# types: () -> none
+		# Send everything pending in one message - the prebuilt commands are never changed, so they can go out again and again
+		if self._pending_display:
+			commands = []
+			for target, value in self._pending_display.items():
+				cmd = self._status_cmds.get((target, value))
+				commands.append(cmd if cmd is not None else messaging.Command(display.SET_STATUS, target, value))
+			self._ehandler(messaging.DisplayTxBatch(commands))
+			self._pending_display.clear()
 
 	#---------------------------------------------------------------------------
 	# _evaluate_programming Method
 	#---------------------------------------------------------------------------
-	def _evaluate_programming(self, ForceUpdate = False):
-		# types: (boolean) -> none
+	def _evaluate_programming(self, ForceUpdate = False, cur_time = None):
+		# types: (boolean, struct_time) -> none
 		# Read the current temperature
+		prev_relay = self._relay_on
 		try:  # Protect against I2C communication error
-			cur_temp = self._temp_sensor.read_temperature()
-			self._temperature = cur_temp	# Store the last temperature read
-			temp_str = '%.1f' % cur_temp
-			update_db = ForceUpdate
+			cur_temp = self._get_temperature()
 		except pigpio.error:
 			self._logger.critical('  ERROR READING TEMPERATURE DURING CONTROL LOOP - SKIPPING THERMOSTAT EVALUATION')
 		else:
-			# Get the current time
-			cur_time = time.localtime()
-			cur_hour = cur_time.tm_hour + (60*cur_time.tm_min + cur_time.tm_sec)/3600.0
+			# Get the current time, unless the caller already has it
+			if cur_time is None:
+				cur_time = time.localtime()
+			cur_secs = 3600*cur_time.tm_hour + 60*cur_time.tm_min + cur_time.tm_sec
 			cur_day = cur_time.tm_wday
-			self._logger.debug('  Measured temperature %.2f Celsius on day %i at hour %.2f', cur_temp, cur_day, cur_hour)
-
-			# Update the display with the current temperature
-			if self._indoor_temp_str != temp_str:
-				self._logger.debug('  Writing string %s to the display', temp_str)
-				self._ehandler(messaging.DisplayTxMessage(messaging.Command(display.SET_STATUS, display.INSIDE_TEMP, temp_str)))
-				self._indoor_temp_str = temp_str
+			if self._debug_logging:
+				self._logger.debug('  Measured temperature %.2f Celsius on day %i at %02i:%02i', cur_temp, cur_day, cur_time.tm_hour, cur_time.tm_min)
 
 			# Temperature checks
 			# ----------------------------------------------------------------------
-			if cur_temp < MIN_TEMPERATURE:	# Temperature below limit, turn on relay
-				self._logger.debug('  Temperature below minimum temperature limit of %.2f Celsius', MIN_TEMPERATURE)
-				if not self._relay_on:	# Turn on the relay if it is off
+			relay_on = prev_relay
+			if MIN_TEMPERATURE <= cur_temp <= MAX_TEMPERATURE:	# Temperature is within limits, the usual case, so find the setpoint to control to
+				setpoint = None
+				if self._override_on:	# Override is on, so evaluate against its setpoint
+					if self._debug_logging:
+						self._logger.debug('  Override Mode On - Checking against override setpoint (%.2f)', self._setpoint)
+					setpoint = self._setpoint
+				elif self._thermo_on:	# Check against the rules
+					if self._debug_logging:
+						self._logger.debug('  Programming Mode On - Checking against programmed rules')
+					setpoint = self._find_setpoint(cur_day, cur_secs)
+					if setpoint is None:
+						if self._debug_logging:
+							self._logger.debug('    No programming rules - relay not changed')
+				else:  # Thermostat is off, so no update
+					if self._debug_logging:
+						self._logger.debug('    Thermostat off - no change')
+
+				# Determine how to control the relay
+				if setpoint is not None:
+					if relay_on and cur_temp > setpoint + TEMPERATURE_BUFFER:
+						# Temperature exceeds setpoint, so turn off relay
+						if self._debug_logging:
+							self._logger.debug('    Relay turned off as temperature greater than setpoint (%.2f Celsius)', setpoint)
+						self._set_relay_status(RELAY_OFF)
+					elif not relay_on and cur_temp < setpoint - TEMPERATURE_BUFFER:
+						# Temperature below setpoint, so turn on relay
+						if self._debug_logging:
+							self._logger.debug('    Relay turned on as temperature less than setpoint (%.2f Celsius)', setpoint)
+						self._set_relay_status(RELAY_ON)
+					else:
+						# No change
+						if self._debug_logging:
+							self._logger.debug('    Relay remains %s as setpoint is %.2f Celsius', 'on' if relay_on else 'off', setpoint)
+					self._setpoint = setpoint	# Keep track of current temperature setpoint
+			elif cur_temp < MIN_TEMPERATURE:	# Temperature below limit, turn on relay
+				if self._debug_logging:
+					self._logger.debug('  Temperature below minimum temperature limit of %.2f Celsius', MIN_TEMPERATURE)
+				if not relay_on:	# Turn on the relay if it is off
 					self._set_relay_status(RELAY_ON)	# Turn on relay
-					update_db = True	# Update the database due to relay state change
-			elif cur_temp > MAX_TEMPERATURE:	# Temperature above limit, turn off relay
-				self._logger.debug('  Temperature above maximum temperature limit of %.2f Celsius', MAX_TEMPERATURE)
-				if self._relay_on:	# Turn off the relay if it is on
+			else:	# Temperature above limit, turn off relay
+				if self._debug_logging:
+					self._logger.debug('  Temperature above maximum temperature limit of %.2f Celsius', MAX_TEMPERATURE)
+				if relay_on:	# Turn off the relay if it is on
 					self._set_relay_status(RELAY_OFF)	# Turn off relay
-					update_db = True	# Update due to relay state change
-			elif self._override_on:	# Override is on, so evaluate against setpoint
-				# Evaluate against the override setpoint
-				self._logger.debug('  Override Mode On - Checking against override setpoint (%.2f)', self._setpoint)
-				if self._relay_on and (cur_temp > (self._setpoint + TEMPERATURE_BUFFER)):
-					# Temperature exceeds override, so turn off relay
-					self._set_relay_status(RELAY_OFF)
-					update_db = True
-				elif not self._relay_on and (cur_temp < (self._setpoint - TEMPERATURE_BUFFER)):
-					# Temperature below override, so turn on relay
-					self._set_relay_status(RELAY_ON)
-					update_db = True
-				else:
-					# No change
-					self._logger.debug('    Relay not changed')
-			elif self._thermo_on:	# Temperature is within limits, so check against rules
-				self._logger.debug('  Programming Mode On - Checking against programmed rules')
-				rule_found = False	# Flag for finding the rule
-				while not rule_found:	# Iterate through the rules until one is found
-					for cur_rule in self._user_config['programming_rules']:
-						if self._rule_applies(cur_rule, cur_day, cur_hour): # Rule applies
-							# Determine how to control the relay
-							if self._relay_on and (cur_temp > (cur_rule['temperature'] + TEMPERATURE_BUFFER)):
-								# Temperature exceeds rule, so turn off relay
-								self._logger.debug('    Relay turned off as temperature greater than setpoint (%.2f Celsius)', cur_rule['temperature'])
-								self._set_relay_status(RELAY_OFF)
-								update_db = True
-							elif not self._relay_on and (cur_temp < (cur_rule['temperature'] - TEMPERATURE_BUFFER)):
-								# Temperature below rule, so turn on relay
-								self._logger.debug('    Relay turned on as temperature less than setpoint (%.2f Celsius)', cur_rule['temperature'])
-								self._set_relay_status(RELAY_ON)
-								update_db = True
-							else:
-								# No change
-								self._logger.debug('    Relay remains %s as setpoint is %.2f Celsius', 'on' if self._relay_on else 'off', cur_rule['temperature'])
-
-							# Rule found, so break from the loop
-							rule_found = True
-							self._setpoint = cur_rule['temperature']	# Keep track of current temperature setpoint
-							break
-					else:	# Rule not found
-						# Decrease the day, but increase the time
-						self._logger.debug('  Could not find the appropriate rule, moving back one day')
-						if cur_day == RULE_DAYS['Monday']:
-							cur_day = RULE_DAYS['Sunday']
-						else:
-							cur_day -= 1
-						cur_hour += 24.0
-			else:  # Thermostat is off, so no update
-				self._logger.debug('    Thermostat off - no change')
+
+			# Update the display with the current temperature - small changes are left until the relay changes, so
+			# sensor noise across a rounding step does not flip the display every cycle
+			#-----------------------------------------------------------------------
+			relay_changed = self._relay_on != relay_on
+			if relay_changed or self._display_temp is None or abs(cur_temp - self._display_temp) >= DISPLAY_TEMP_CHANGE:
+				temp_str = '%.1f' % cur_temp
+				if self._indoor_temp_str != temp_str:
+					if self._debug_logging:
+						self._logger.debug('  Writing string %s to the display', temp_str)
+					self._send_display(display.INSIDE_TEMP, temp_str)
+					self._indoor_temp_str = temp_str
+					self._display_temp = cur_temp
 
 			# Send thermostat status to database
 			#-----------------------------------------------------------------------
-			if update_db:
-				self._update_database(cur_temp)
+			if ForceUpdate or relay_changed:	# Only a relay change makes this more than the periodic update
+				self._update_database(cur_temp, not relay_changed)
 
 			# Update the display with the setpoint
 			#-----------------------------------------------------------------------
-			setpoint_str = 'Setpoint: %.1f' % self._setpoint
-			if self._setpoint_str != setpoint_str:	# Only update if new string
-				self._ehandler(messaging.DisplayTxMessage(messaging.Command(display.SET_STATUS, display.SETPOINT_TEMP, setpoint_str)))
-				self._setpoint_str = setpoint_str
+			if self._display_setpoint != self._setpoint:	# The setpoint rarely changes, so only format it when it does
+				self._display_setpoint = self._setpoint
+				setpoint_str = 'Setpoint: %.1f' % self._setpoint
+				if self._setpoint_str != setpoint_str:	# Only update if new string
+					self._send_display(display.SETPOINT_TEMP, setpoint_str)
+					self._setpoint_str = setpoint_str
 
 	#---------------------------------------------------------------------------
 	# _update_database Method
 	#---------------------------------------------------------------------------
-	def _update_database(self, temperature = ABSOLUTE_ZERO):
-		# Get sensor data
+	def _update_database(self, cur_temp, Periodic = False):
+		# types: (float, boolean) -> none
+		# Nothing to record until the temperature has been measured once
+		if cur_temp == ABSOLUTE_ZERO:
+			self._logger.error('  No thermostat temperature measured yet - skipping database update')
+			return
+
+		# The override setpoint is only recorded while override is on
+		override = self._setpoint if self._override_on else None
+
+		# Get luminosity and update data record
+		# try:
+		# 	self._logger.debug('  Reading the luminosity')
+		# 	cur_lux = self._lux_sensor.read_luminosity_opt()
+		# except pigpio.error:
+		# 	self._logger.error('  Error reading luminosity - will not update this measurement')
+		# else:
+		# 	cur_data['luminosity_lux'] = cur_lux
+
+		# Get humidity and update data record
 		try:
-			# Get temperature and create update data record
-			self._logger.debug('  Acquiring thermostat sensor data')
-			cur_temp = self._temp_sensor.read_temperature() if temperature == ABSOLUTE_ZERO else temperature
-
-			# Create the data package
-			cur_data = {'temperature': cur_temp,
-			            'thermo_on': 1.0 if self._thermo_on else 0.0,
-			            'heating_on': 1.0 if self._relay_on else 0.0}
-			if self._override_on: cur_data['override'] = self._setpoint
-
-			# Get luminosity and update data record
-			# try:
-			# 	self._logger.debug('  Reading the luminosity')
-			# 	cur_lux = self._lux_sensor.read_luminosity_opt()
-			# except pigpio.error:
-			# 	self._logger.error('  Error reading luminosity - will not update this measurement')
-			# else:
-			# 	cur_data['luminosity_lux'] = cur_lux
-
-			# Get humidity and update data record
-			try:
-				self._logger.debug('  Reading the humidity')
-				cur_h2o = self._temp_sensor.read_humidity()
-			except pigpio.error:
-				self._logger.error('  Error reading humidity - will not update this measurement')
-			else:
-				cur_data['humidity'] = cur_h2o
-
-			# Send the data package message
-			self._logger.info('  Sending thermostat data to be transmitted through the LAN')
-			request = self._create_request(cur_data)
-			self._ehandler(messaging.LANTxMessage(messaging.DBPacket(request)))
+			self._logger.debug('  Reading the humidity')
+			cur_h2o = self._get_humidity()
 		except pigpio.error:
-			self._logger.error('  Error reading thermostat temperature outside control loop - skipping database update')
+			self._logger.error('  Error reading humidity - will not update this measurement')
+			cur_h2o = None
+
+		# Skip a periodic update that would only repeat the last one
+		db_state = (round(cur_temp, 1), self._thermo_on, self._relay_on, override, None if cur_h2o is None else round(cur_h2o))
+		if Periodic and db_state == self._last_db_state:
+			self._logger.debug('  Thermostat data unchanged since the last update - nothing sent to the database')
+			return
+		self._last_db_state = db_state
+
+		# Send the data package message
+		self._logger.info('  Sending thermostat data to be transmitted through the LAN')
+		request = self._create_request(cur_temp, override, cur_h2o)
+		self._ehandler(messaging.LANTxMessage(messaging.DBPacket(request)))
+
+	#---------------------------------------------------------------------------
+	# _get_temperature Method
+	#---------------------------------------------------------------------------
+	def _get_temperature(self):
+		# types: () -> float
+		# Reuse a reading from within half a control cycle, so one cycle never reads the sensor twice
+		now = time.monotonic()
+		if self._temp_time is None or now - self._temp_time >= 0.5*self._sensor_period:
+			self._temperature = self._temp_sensor.read_temperature()	# Raises pigpio.error on a failed read
+			self._temp_time = now
+		return self._temperature
+
+	#---------------------------------------------------------------------------
+	# _get_humidity Method
+	#---------------------------------------------------------------------------
+	def _get_humidity(self):
+		# types: () -> float
+		# Reuse a reading from within half a control cycle, as for the temperature
+		now = time.monotonic()
+		if self._humidity_time is None or now - self._humidity_time >= 0.5*self._sensor_period:
+			self._humidity = self._temp_sensor.read_humidity()	# Raises pigpio.error on a failed read
+			self._humidity_time = now
+		return self._humidity
 
 	#---------------------------------------------------------------------------
 	# _create_request Method
 	#---------------------------------------------------------------------------
-	def _create_request(self, data):
-		# types: (dict) -> string
-		# Initialize the response string
-		resp_str = self._qbase	# Set the base of the query
+	def _create_request(self, temperature, override, humidity):
+		# types: (float, float, float) -> string
+		# The fields are fixed, so format them straight in - the override and humidity are left out when None
+		request = '%s&temperature=%f&thermo_on=%f&heating_on=%f' % ( self._qprefix, temperature,
+																	  1.0 if self._thermo_on else 0.0,
+																	  1.0 if self._relay_on else 0.0 )
+		if override is not None:
+			request += '&override=%f' % override
+		if humidity is not None:
+			request += '&humidity=%f' % humidity
+		return request
 
-		# Include the radio
-		resp_str += 'radio_id=' + self._user_config['thermo_radio']
-			
-		# Iterate through all the sensors adding data
-		for key, value in data.iteritems():
-			resp_str += '&%s=%f' % ( key, value )
-	
-		# Return the string
-		return resp_str
+	#---------------------------------------------------------------------------
+	# _find_setpoint Method
+	#---------------------------------------------------------------------------
+	def _find_setpoint(self, weekday, seconds):
+		# types: (int, int) -> float
+		# The rule in effect is the latest one started this week, or the last one of the week if none has started yet
+		if not self._rule_timeline:
+			return None	# No rules at all
+		index = bisect.bisect_right(self._rule_starts, weekday*SECONDS_PER_DAY + seconds)
+		return self._rule_timeline[index - 1].temperature	# Index 0 wraps around to the end of last week
 
 	#---------------------------------------------------------------------------
-	# _rule_applies Method
+	# _build_rule_timeline Method
 	#---------------------------------------------------------------------------
 	@staticmethod
-	def _rule_applies(rule, weekday, hour):
-		# types: (list, int, float) -> boolean
-		# First check is to see that time is later than the rule
-		if hour >= rule['time']:
-			# Second round of checks
-			if RULE_DAYS[rule['day']] == RULE_DAYS['Everyday']: return True
-			if weekday == RULE_DAYS[rule['day']]: return True
-			if (RULE_DAYS[rule['day']] == RULE_DAYS['Weekdays']) and (weekday <= RULE_DAYS['Friday']): return True
-			if (RULE_DAYS[rule['day']] == RULE_DAYS['Weekends']) and (weekday >= RULE_DAYS['Saturday']): return True
-		
-		return False	# Rule does not match
+	def _build_rule_timeline(rules):
+		# types: (list) -> list
+		# Convert the config rules, expanding the day groups into the individual weekdays
+		week_rules = {}
+		for rule in rules:
+			rule_day = RULE_DAYS[rule['day']]
+			day_mask = RULE_DAY_MASKS.get(rule_day, 1 << rule_day)
+			day_start = int(round(3600*float(rule['time'])))	# Rule times are hours past midnight
+			for day in range(MONDAY, SUNDAY + 1):
+				if (day_mask >> day) & 1:
+					week_rules.setdefault(day*SECONDS_PER_DAY + day_start, float(rule['temperature']))	# The first rule listed for a time wins
+
+		# Order by start time through the week
+		return [ Rule(start, week_rules[start]) for start in sorted(week_rules) ]
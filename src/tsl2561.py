@@ -29,6 +29,7 @@
 
 # Imports
 import time
+import logging
 from i2cbus import I2CBus
 
 #===============================================================================
@@ -57,6 +58,12 @@ TSL2561_CLEAR_BIT			= 0x40	# Clears pending transactions
 TSL2561_WORD_BIT			= 0x20	# Indicates if a word is to be read/written
 TSL2561_BLOCK_BIT			= 0x10	# Turn on blocking
 
+# Command bytes for each register access
+TSL2561_CMD_CONTROL			= TSL2561_COMMAND | TSL2561_CONTROL_REG
+TSL2561_CMD_TIMING			= TSL2561_COMMAND | TSL2561_TIMING_REG
+TSL2561_CMD_READ_CH0		= TSL2561_COMMAND | TSL2561_WORD_BIT | TSL2561_CH0_DATA_LOW
+TSL2561_CMD_READ_CH1		= TSL2561_COMMAND | TSL2561_WORD_BIT | TSL2561_CH1_DATA_LOW
+
 # Power options
 TSL2561_POWER_OFF			= 0x00	# Power down the device
 TSL2561_POWER_ON			= 0x03	# Power on the device
@@ -70,6 +77,33 @@ TSL2561_INTEGRATE_SHORT		= 0x00	# Shortest (13.7 ms) window
 TSL2561_INTEGRATE_MEDIUM	= 0x01	# Middle (101 ms) window
 TSL2561_INTEGRATE_LONG		= 0x02	# Longest (402 ms) window
 
+# Scaling of each integration window to the longest window
+INTEGRATION_SCALE = {
+	TSL2561_INTEGRATE_SHORT:	402.0/13.7,
+	TSL2561_INTEGRATE_MEDIUM:	402.0/101.0,
+	TSL2561_INTEGRATE_LONG:		1.0 }
+
+# Time to wait for each integration window to complete
+INTEGRATION_WAIT = {
+	TSL2561_INTEGRATE_SHORT:	0.02,	# 20 ms (6 ms extra)
+	TSL2561_INTEGRATE_MEDIUM:	0.11,	# 110 ms (9 ms extra)
+	TSL2561_INTEGRATE_LONG:		0.41 }	# 410 ms (8 ms extra)
+
+# Scaling of each gain to the high gain
+GAIN_SCALE = {
+	TSL2561_GAIN_LOW:	16.0,
+	TSL2561_GAIN_HIGH:	1.0 }
+
+# Every gain/integration setting, ordered from least to most sensitive
+TIMING_STEPS = sorted(((gain, int_period) for gain in GAIN_SCALE for int_period in INTEGRATION_SCALE),
+	key=lambda step: -GAIN_SCALE[step[0]]*INTEGRATION_SCALE[step[1]])
+
+# Signal levels for optimizing the settings
+SIGNAL_SATURATED			= 0xFFFF	# Channel reading when the sensor is saturated
+SIGNAL_LOW					= 10		# Channel readings below this are too coarse
+SIGNAL_TARGET				= 40000		# Aim for the brighter channel to be below this after a change
+SIGNAL_OVER					= 16*SIGNAL_TARGET	# Assumed reading when saturated, so each retry drops about a gain step
+
 # Channel options
 TSL2561_CHANNEL_0			= 0		# The visible + IR sensor
 TSL2561_CHANNEL_1			= 1		# The IR only sensor
@@ -82,6 +116,9 @@ TSL2561_CHANNEL_1			= 1		# The IR only sensor
 # Class Members
 #	_gain:			The current gain setting of the device
 #	_int_period:	The current integration setting
+#	_scale:			The scaling of the raw counts for the current gain and integration settings
+#	_int_wait:		The time in seconds to wait for the current integration window
+#	_logger:		The logger for the sensor
 #
 class TSL2561(I2CBus):
 	#---------------------------------------------------------------------------
@@ -94,14 +131,15 @@ class TSL2561(I2CBus):
 		:param bus_number: The number of the I2C bus that the TSL2561 is on
 		"""
 		I2CBus.__init__(self, bus_number, TSL2561_BUS_ADDRESS)
+		self._logger = logging.getLogger('MAIN.TSL2561')
 		
 		# Determine the current sensor settings
-		command = TSL2561_COMMAND | TSL2561_TIMING_REG
-		response = self._read_register(command, 1)	# Get the integration/gain settings
+		response = self._read_register(TSL2561_CMD_TIMING, 1)	# Get the integration/gain settings
 		
 		# Set settings
 		self._gain = response[0] & TSL2561_GAIN_HIGH
 		self._int_period = response[0] & TSL2561_INTEGRATE_LONG
+		self._update_timing()
 
 	#---------------------------------------------------------------------------
 	# enable Method
@@ -112,8 +150,7 @@ class TSL2561(I2CBus):
 		"""
 		Turn on the power to the sensor.
 		"""
-		command = TSL2561_COMMAND | TSL2561_CONTROL_REG
-		self._write_register(command, [ TSL2561_POWER_ON ])	# Send command to turn on power
+		self._write_register(TSL2561_CMD_CONTROL, [ TSL2561_POWER_ON ])	# Send command to turn on power
 
 	#---------------------------------------------------------------------------
 	# disable Method
@@ -124,8 +161,7 @@ class TSL2561(I2CBus):
 		"""
 		Turn off the power to the sensor.
 		"""
-		command = TSL2561_COMMAND | TSL2561_CONTROL_REG
-		self._write_register(command, [ TSL2561_POWER_OFF ]) # Send command to turn off power
+		self._write_register(TSL2561_CMD_CONTROL, [ TSL2561_POWER_OFF ]) # Send command to turn off power
 
 	#---------------------------------------------------------------------------
 	# set_timing Method
@@ -141,11 +177,23 @@ class TSL2561(I2CBus):
 		# Set the internal setting
 		self._gain = gain
 		self._int_period = int_period
+		self._update_timing()
 		
 		# Update timing
-		command = TSL2561_COMMAND | TSL2561_TIMING_REG
 		option = self._gain | self._int_period
-		self._write_register(command, [ option ])
+		self._write_register(TSL2561_CMD_TIMING, [ option ])
+
+	#---------------------------------------------------------------------------
+	# _update_timing Method
+	#---------------------------------------------------------------------------
+	# Recalculates the values that depend on the settings after a change
+	def _update_timing(self):
+		# types: (none) -> none
+		"""
+		Set the scaling factor and integration wait for the current integration/gain settings.
+		"""
+		self._scale = INTEGRATION_SCALE[self._int_period]*GAIN_SCALE[self._gain]
+		self._int_wait = INTEGRATION_WAIT[self._int_period]
 
 	#---------------------------------------------------------------------------
 	# get_channel_data Method
@@ -159,20 +207,45 @@ class TSL2561(I2CBus):
 		"""
 		# Turn on the sensor and wait for integration period
 		self.enable()
-		if self._int_period == TSL2561_INTEGRATE_SHORT:
-			time.sleep(0.02)	# Sleep for 20 ms (6 ms extra)
-		elif self._int_period == TSL2561_INTEGRATE_MEDIUM:
-			time.sleep(0.11)	# Sleep for 110 ms (9 ms extra)
-		else:
-			time.sleep(0.41)	# Sleep for 410 ms (8 ms extra)
+		self._wait_integration()
 		
 		# Get the data and return
-		command = TSL2561_COMMAND | TSL2561_WORD_BIT | (TSL2561_CH0_DATA_LOW if channel == TSL2561_CHANNEL_0 else TSL2561_CH1_DATA_LOW)
-		data = self._read_register(command, 2)
+		data = self._read_register(TSL2561_CMD_READ_CH0 if channel == TSL2561_CHANNEL_0 else TSL2561_CMD_READ_CH1, 2)
 		self.disable()
 		
 		return (data[1] << 8) | data[0]
 
+	#---------------------------------------------------------------------------
+	# _read_both_channels Method
+	#---------------------------------------------------------------------------
+	# Reads the raw measured luminosity from both channels in one integration
+	def _read_both_channels(self):
+		# types: (none) -> tuple
+		"""
+		Read the data from both channels with a single power cycle and I2C read.
+		:return: The channel 0 and channel 1 data
+		"""
+		# Turn on the sensor and wait for integration period
+		self.enable()
+		self._wait_integration()
+		
+		# The data registers are consecutive, so read all four bytes at once
+		data = self._read_register(TSL2561_CMD_READ_CH0, 4)
+		self.disable()
+		
+		return ((data[1] << 8) | data[0], (data[3] << 8) | data[2])
+
+	#---------------------------------------------------------------------------
+	# _wait_integration Method
+	#---------------------------------------------------------------------------
+	# Waits for the current integration window to complete
+	def _wait_integration(self):
+		# types: (none) -> none
+		"""
+		Sleep long enough for the current integration period to finish.
+		"""
+		time.sleep(self._int_wait)
+
 	#---------------------------------------------------------------------------
 	# _convert_lux Method
 	#---------------------------------------------------------------------------
@@ -187,16 +260,8 @@ class TSL2561(I2CBus):
 		"""
 		# Calculate luminosity from measured data
 		if chan0 != 0:
-			# Determine scaling factor - account for integration time
-			if self._int_period == TSL2561_INTEGRATE_SHORT:
-				scale = 402.0/13.7
-			elif self._int_period == TSL2561_INTEGRATE_MEDIUM:
-				scale = 402.0/101.0
-			else:
-				scale = 1.0
-			scale *= 16.0 if self._gain == TSL2561_GAIN_LOW else 1.0	# Account for gain
-			
 			# Scale measurements
+			scale = self._scale
 			d0 = scale*chan0
 			d1 = scale*chan1
 			
@@ -228,9 +293,8 @@ class TSL2561(I2CBus):
 		:return: The measured luminosity in lux
 		"""
 		# Get the measured data in both channels
-		chan0_data = self.get_channel_data(TSL2561_CHANNEL_0)
-		chan1_data = self.get_channel_data(TSL2561_CHANNEL_1)
-		print '\tRaw data: %04x %04x' % (chan0_data, chan1_data)
+		(chan0_data, chan1_data) = self._read_both_channels()
+		self._logger.debug('Raw data: %04x %04x', chan0_data, chan1_data)
 		
 		# Return the lux
 		return self._convert_lux(chan0_data, chan1_data)
@@ -246,43 +310,38 @@ class TSL2561(I2CBus):
 		Optimizes the sensor settings to give best luminosity reading.
 		:return: The measured luminosity in lux
 		"""
-		# Initialize variables
-		lux_captured = False
-		chan0_data = chan1_data = 0
-		gain = self._gain
-		int_period = self._int_period
+		# Initialize variables - the range of settings that have not been ruled out
+		lowest = 0
+		highest = len(TIMING_STEPS) - 1
 		
 		# Loop until acceptable luminosity found
-		while not lux_captured:
+		while True:
 			# Get raw luminosity measurement
-			chan0_data = self.get_channel_data(TSL2561_CHANNEL_0)
-			chan1_data = self.get_channel_data(TSL2561_CHANNEL_1)
-#			print '\tRaw data: %04x %04x %i %i' % (chan0_data, chan1_data, self._gain, self._int_period)
+			(chan0_data, chan1_data) = self._read_both_channels()
+			self._logger.debug('Raw data: %04x %04x %i %i', chan0_data, chan1_data, self._gain, self._int_period)
 			
-			# Evaluate signal strength - this is a bit crude with gain treatment
-			if (chan0_data == 0xFFFF) or (chan1_data == 0xFFFF):	# Saturated signal
-				# Sensor saturated, so adjust timing
-				if gain == TSL2561_GAIN_HIGH:	# Lower the gain
-					gain = TSL2561_GAIN_LOW
-					int_period = TSL2561_INTEGRATE_LONG	# To search for a good integration for the gain setting
-				elif int_period > TSL2561_INTEGRATE_SHORT:	# Reduce integration time
-					int_period -= 1
-				else:	# Can't make further adjustments, so have to live with this
-					lux_captured = True
-			elif (chan0_data < 10) or (chan1_data < 10):	# Low signal
-				# Low signal, so try adjusting timing
-				if int_period < TSL2561_INTEGRATE_LONG:	# Increase integration time
-					int_period += 1
-				elif gain == TSL2561_GAIN_LOW:	# Increase the gain
-					gain = TSL2561_GAIN_HIGH
-					int_period = TSL2561_INTEGRATE_SHORT	# To search for a good integration time for gain
-				else:	# Can't make further changes
-					lux_captured = True
+			# Evaluate signal strength, ruling out this setting and any beyond it
+			cur_step = TIMING_STEPS.index((self._gain, self._int_period))
+			if (chan0_data == SIGNAL_SATURATED) or (chan1_data == SIGNAL_SATURATED):	# Saturated signal
+				highest = cur_step - 1
+				peak = SIGNAL_OVER
+			elif (chan0_data < SIGNAL_LOW) or (chan1_data < SIGNAL_LOW):	# Low signal
+				lowest = cur_step + 1
+				peak = max(chan0_data, chan1_data)
 			else:	# Signal is good
-				lux_captured = True
+				break
+			if lowest > highest:	# Can't make further adjustments, so have to live with this
+				break
 			
-			# If needed, reset the timing
-			if not lux_captured: self.set_timing(gain, int_period)
+			# The counts scale with the settings, so jump straight to the most sensitive setting expected to stay below the target
+			min_scale = peak*self._scale/SIGNAL_TARGET
+			next_step = lowest
+			for step in range(highest, lowest, -1):
+				gain, int_period = TIMING_STEPS[step]
+				if GAIN_SCALE[gain]*INTEGRATION_SCALE[int_period] >= min_scale:
+					next_step = step
+					break
+			self.set_timing(*TIMING_STEPS[next_step])
 		
 		# Return the luminosity in lux
 		return self._convert_lux(chan0_data, chan1_data)
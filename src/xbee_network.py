@@ -39,8 +39,10 @@ import display
 #===============================================================================
 # CONSTANTS
 #===============================================================================
-# Timing
-XBEE_WAIT_INTERVAL = 60	# Delay in seconds in each main thread loop
+# Serial port
+XBEE_PORT			= '/dev/ttyUSB0'
+XBEE_BAUD_RATE		= 9600
+XBEE_READ_TIMEOUT	= 0.1	# Longest a read of the port blocks, in seconds
 
 # XBee Data Codes
 TEMPERATURE_CODE	=  1
@@ -55,6 +57,21 @@ TEMP_12BYTE_CODE	=  9
 BATTERY_SOC_CODE	= 10
 OVERRIDE_CODE		= 11
 
+# Database field for each data code
+DATA_LABELS = {
+	TEMPERATURE_CODE:	'&temperature=',
+	LUMINOSITY_CODE:	'&luminosity=',
+	PRESSURE_CODE:		'&pressure=',
+	HUMIDITY_CODE:		'&humidity=',
+	POWER_CODE:			'&power=',
+	LUX_CODE:			'&luminosity_lux=',
+	HEATING_CODE:		'&heating_on=',
+	THERMOSTAT_CODE:	'&thermo_on=',
+	BATTERY_SOC_CODE:	'&battery_soc=',
+	OVERRIDE_CODE:		'&override=' }
+
+# Each sensor record is a type byte followed by a little-endian single-precision float
+SENSOR_RECORD = struct.Struct('<Bf')
 
 #===============================================================================
 # XBeeMessages Class
@@ -63,6 +80,7 @@ OVERRIDE_CODE		= 11
 #
 # Class Members
 #	_ehandler	:	The callback function that will handle incoming XBee messages
+#	_debug_logging	:	Indicates if debug messages are being logged
 #	_kill_event	:	The event signaling a shutdown of the thread
 #
 class XBeeNetwork(threading.Thread):
@@ -79,6 +97,7 @@ class XBeeNetwork(threading.Thread):
 
 		# Intialize logger
 		self._logger = logging.getLogger('MAIN.XBEE')
+		self._debug_logging = self._logger.isEnabledFor(logging.DEBUG)	# The level is fixed by the config file, so check it once
 
 		# Initialize as a thread
 		self._kill_event = kill_event
@@ -91,12 +110,15 @@ class XBeeNetwork(threading.Thread):
 		# types: (none) -> none
 		# Connect to the local XBee
 		self._logger.debug('Starting the XBee Network thread')
-		serial_port = serial.Serial('/dev/ttyUSB0', 9600)
+		serial_port = serial.Serial(XBEE_PORT, XBEE_BAUD_RATE, timeout=XBEE_READ_TIMEOUT)
+		try:	# Hand frames over as they arrive, rather than on the USB adapter's latency timer
+			serial_port.set_low_latency_mode(True)
+		except (AttributeError, NotImplementedError, ValueError, IOError) as err:
+			self._logger.debug('  Serial low latency mode is not available: %s', err)
 		xbee = ZigBee(serial_port, callback=self._xbee_event)
 		
-		# Loop until time to close
-		while not self._kill_event.is_set():
-			self._kill_event.wait(XBEE_WAIT_INTERVAL)
+		# The XBee callback thread does the work, so just wait until time to close
+		self._kill_event.wait()
 	
 		# Close the connection to the xbee
 		xbee.halt()
@@ -110,8 +132,8 @@ class XBeeNetwork(threading.Thread):
 		# types: (dict) -> string
 		# Iterate through each of the keys
 		data_str = ''  # Initialize string to be empty
-		for cur_key in data:
-			data_str += '    %s: %s\n' % ( cur_key, messaging.binary_print(data[cur_key]) ) 
+		for cur_key, value in data.items():
+			data_str += '    %s: %s\n' % ( cur_key, value if isinstance(value, str) else messaging.binary_print(value) )
 		return data_str[:-1]  # Cut off the training new line
 	
 	#---------------------------------------------------------------------------
@@ -121,107 +143,100 @@ class XBeeNetwork(threading.Thread):
 		# types: (dict) -> none
 		# Check the message type
 		self._logger.info('Received an XBee data packet')
-		self._logger.debug('  Data packet is:\n%s', self._xbee_data_string(data))
+		if self._debug_logging:	# Only build the packet dump if it will be logged
+			self._logger.debug('  Data packet is:\n%s', self._xbee_data_string(data))
 		if 'id' in data and data['id'] == 'rx':	# Sensor data received
 			# Create database update string and send to the database over the LAN
-			request_str = self._create_request(data)
+			radio_id = data['source_addr_long'][-4:].hex()	# Used for the query and the outdoor check
+			(request_str, outdoor_temp) = self._process_packet(data, radio_id)
 			if request_str:	# Something to send
 				# Send the message out to the database
 				self._logger.info('  Sending XBee data to be transmitted through the LAN')
 				self._ehandler(messaging.LANTxMessage(messaging.DBPacket(request_str)))
 
 				# Check to see if this is the outdoor sensor, and update display if it is
-				xbee_address = messaging.binary_print(data['source_addr_long'][-4:], '')
-				self._logger.debug('    Checking if %s is the outdoor sensor', xbee_address)
-				if xbee_address == self._outdoor_radio:
-					self._logger.debug('    Updating the display with the outdoor temperature')
-					self._update_display(data)
+				if self._debug_logging:
+					self._logger.debug('    Checking if %s is the outdoor sensor', radio_id)
+				if radio_id == self._outdoor_radio and outdoor_temp is not None:
+					if self._debug_logging:
+						self._logger.debug('    Updating the display with the outdoor temperature')
+					self._update_display(outdoor_temp)
 		else:	# Something else received
 			self._logger.warning('  Received something unexpected from the XBee network: %s', data)
 
 	#---------------------------------------------------------------------------
-	# _create_request Method
+	# _process_packet Method
 	#---------------------------------------------------------------------------
-	def _create_request(self, data):
-		# types: (dict) -> string
+	def _process_packet(self, data, radio_id):
+		# types: (dict, string) -> (string, float)
+		# Parse the packet once, creating the database insert string and picking out the last temperature for the display
+		temperature = None
+		
 		# Initialize the response string
-		self._logger.debug('  Starting the creation of the database insert string')
-		resp_str = self._qbase	# Set the base of the query
-		self._logger.debug('    Initial query string is: %s', resp_str)
+		debug_logging = self._debug_logging
+		if debug_logging:
+			self._logger.debug('  Starting the creation of the database insert string')
+			self._logger.debug('    Initial query string is: %s', self._qbase)
+		query = [ self._qbase ]	# Set the base of the query, the pieces are joined once complete
 
 		# Check for funny number of bytes
 		data_length = len(data['rf_data']) - 1
-		self._logger.debug('    Length of byte data in packet is %i', data_length)
-		if data_length % 5:
+		if debug_logging:
+			self._logger.debug('    Length of byte data in packet is %i', data_length)
+		if data_length % SENSOR_RECORD.size:
 			self._logger.error('    Corrupted data transmitted through XBee network: incorrect XBee packet size')
 			resp_str = ''	# Empty string signals an error
 		else:
 			# Include the radio
-			self._logger.debug('    Adding radio id to the query string')
-			resp_str += 'radio_id='
-			resp_str += messaging.binary_print(data['source_addr_long'][-4:], '')
+			if debug_logging:
+				self._logger.debug('    Adding radio id to the query string')
+			query.append('radio_id=')
+			query.append(radio_id)
 			
 			# Iterate through all the sensors adding data
-			num_sensors = data_length/5	# Data transferred in 5-byte chunks
-			self._logger.debug('    Adding data for %i sensors to the query string', num_sensors)
-			for i in range(num_sensors):
-				# Read the first byte which gives the data type
+			num_sensors = data_length//SENSOR_RECORD.size	# Data transferred in 5-byte chunks
+			if debug_logging:
+				self._logger.debug('    Adding data for %i sensors to the query string', num_sensors)
+			for i, (type_byte, float_value) in enumerate(self._sensor_records(data)):
+				# The first byte gives the data type
 #				is_pressure = False
 #				is_override = False
-				self._logger.debug('      Evaluating reading for sensor %i', i)
-				type_byte = ord(data['rf_data'][5*i+1])
-				self._logger.debug('        Sensor type is %i', type_byte)
+				if debug_logging:
+					self._logger.debug('      Evaluating reading for sensor %i', i)
+					self._logger.debug('        Sensor type is %i', type_byte)
 				
-				# Create the label for the sensor data
-				type_error = False
-				if type_byte == TEMPERATURE_CODE:
-					resp_str += '&temperature='
-				elif type_byte == LUMINOSITY_CODE:
-					resp_str += '&luminosity='
-				elif type_byte == PRESSURE_CODE:
-					resp_str += '&pressure='
-#					is_pressure = True
-				elif type_byte == HUMIDITY_CODE:
-					resp_str += '&humidity='
-				elif type_byte == POWER_CODE: 
-					resp_str += '&power='
-				elif type_byte == LUX_CODE:
-					resp_str += '&luminosity_lux='
-				elif type_byte == HEATING_CODE:
-					resp_str += '&heating_on='
-				elif type_byte == THERMOSTAT_CODE:
-					resp_str += '&thermo_on='
-				elif type_byte == BATTERY_SOC_CODE:
-					resp_str += '&battery_soc='
-				elif type_byte == OVERRIDE_CODE:
-					resp_str += '&override='
-#					is_override = True
-				else:	# Unrecognized
+				# Add the label for the sensor data, skipping anything unrecognized
+				label = DATA_LABELS.get(type_byte)
+				if label is None:
 					self._logger.error('    Unrecognized sensor data type: %i -> skipping data', type_byte)
-					type_error = True
+					continue
+				query.append(label)
+				if type_byte == TEMPERATURE_CODE:	# Keep the last, which is the latest sample
+					temperature = float_value
 				
-				# Convert the binary data to a float and add to string
-				if not type_error:
-					self._logger.debug('        Converting byte array to float')
-					float_value = struct.unpack('f', data['rf_data'][5*i+2:5*i+6])
-					resp_str += '%f' % float_value
+				# Add the float value to the string
+				query.append('%f' % float_value)
+			resp_str = ''.join(query)
 					
-		# Return the string
-		self._logger.debug('  Finished database insert string creation: %s', resp_str)
-		return resp_str
+		# Return the string and temperature
+		if debug_logging:
+			self._logger.debug('  Finished database insert string creation: %s', resp_str)
+		return (resp_str, temperature)
 
 	#---------------------------------------------------------------------------
 	# _update_display Method
 	#---------------------------------------------------------------------------
-	def _update_display(self, data):
-		# types: (map) -> None
-		# Iterate through the data looking for the temperature - this coding assumes that the data is ok as a response
-		# string was created in a previous function call.  No data quality checks are made.
-		data_length = len(data['rf_data']) - 1
-		num_sensors = data_length / 5  # Data transferred in 5-byte chunks
-		for i in range(num_sensors):
-			type_byte = ord(data['rf_data'][5 * i + 1])
-			if type_byte == TEMPERATURE_CODE:  # Found temperature, convert to string and send to the display
-				float_value = struct.unpack('f', data['rf_data'][5*i+2:5*i+6])  # Convert the bytes to a single-precision float
-				display_str = 'Outdoor: %.1f' % float_value
-				self._ehandler(messaging.DisplayTxMessage(messaging.Command(display.SET_STATUS, display.OUTSIDE_TEMP, display_str)))
+	def _update_display(self, temperature):
+		# types: (float) -> None
+		# Send the outdoor temperature to the display
+		display_str = 'Outdoor: %.1f' % temperature
+		self._ehandler(messaging.DisplayTxMessage(messaging.Command(display.SET_STATUS, display.OUTSIDE_TEMP, display_str)))
+
+	#---------------------------------------------------------------------------
+	# _sensor_records Method
+	#---------------------------------------------------------------------------
+	@staticmethod
+	def _sensor_records(data):
+		# types: (dict) -> generator
+		# The records follow the leading option byte
+		return SENSOR_RECORD.iter_unpack(data['rf_data'][1:])
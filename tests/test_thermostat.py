@@ -0,0 +1,61 @@
+# test_thermostat.py
+# Tests of the thermostat control loop, with the hardware interfaces replaced
+# by stand-ins so the thread logic can run off the Pi.
+
+# Imports
+import os
+import sys
+import threading
+import time
+import types
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+#-------------------------------------------------------------------------------
+# Hardware stand-ins
+#-------------------------------------------------------------------------------
+class FakeDevice(object):
+	# Accepts any call made on the GPIO bus or a sensor
+	def __getattr__(self, name):
+		return lambda *args, **kwargs: 0
+
+if 'pigpio' not in sys.modules:
+	sys.modules['pigpio'] = types.SimpleNamespace(pi=FakeDevice, OUTPUT=1, INPUT=0)
+if 'geniePi' not in sys.modules:
+	sys.modules['geniePi'] = types.ModuleType('geniePi')
+if 'htu21d' not in sys.modules:
+	sys.modules['htu21d'] = types.SimpleNamespace(HTU21D=lambda bus: FakeDevice())
+
+import thermostat
+
+#===============================================================================
+# ThermostatRunTest Class
+#===============================================================================
+class ThermostatRunTest(unittest.TestCase):
+	#---------------------------------------------------------------------------
+	# test_shutdown_delay_does_not_spin
+	#---------------------------------------------------------------------------
+	def test_shutdown_delay_does_not_spin(self):
+		# The loop should sleep until the shutdown deadline rather than poll its inbox
+		kill_event = threading.Event()
+		thermo = thermostat.Thermostat(lambda msg: None, kill_event, 0.05, 10, '/q?', { 'thermo_radio': 'test', 'programming_rules': [] })
+		thermo._handle_tick = lambda: None	# No sensor reads
+
+		# Count the inbox reads, and request the shutdown past several control periods
+		get_calls = [0]
+		inbox_get = thermo._inbox.get
+		def counting_get(*args, **kwargs):
+			get_calls[0] += 1
+			return inbox_get(*args, **kwargs)
+		thermo._inbox.get = counting_get
+		thermo._shutdown_deadline = time.monotonic() + 0.5
+
+		thermo.start()
+		thermo.join(2.0)
+		self.assertFalse(thermo.is_alive())
+		self.assertTrue(kill_event.is_set())
+		self.assertLessEqual(get_calls[0], 3)
+
+if __name__ == '__main__':
+	unittest.main()
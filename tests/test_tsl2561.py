@@ -0,0 +1,73 @@
+# test_tsl2561.py
+# Tests of the TSL2561 gain/integration search, with the I2C bus replaced by a
+# simulated sensor whose counts scale with the settings.
+
+# Imports
+import os
+import sys
+import types
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+#-------------------------------------------------------------------------------
+# Hardware stand-ins
+#-------------------------------------------------------------------------------
+class FakeDevice(object):
+	# Accepts any call made on the I2C bus
+	def __getattr__(self, name):
+		return lambda *args, **kwargs: 0
+
+if 'pigpio' not in sys.modules:
+	sys.modules['pigpio'] = types.SimpleNamespace(pi=FakeDevice)
+
+import tsl2561
+
+#===============================================================================
+# ReadLuminosityOptTest Class
+#===============================================================================
+class ReadLuminosityOptTest(unittest.TestCase):
+	#---------------------------------------------------------------------------
+	# _sensor Method
+	#---------------------------------------------------------------------------
+	def _sensor(self, light, start):
+		# Build a sensor at the starting setting that counts light/_scale, saturating at 0xFFFF
+		sensor = tsl2561.TSL2561.__new__(tsl2561.TSL2561)
+		sensor._bus = FakeDevice()
+		sensor._handle = 0
+		sensor._logger = tsl2561.logging.getLogger('TEST.TSL2561')
+		sensor._gain, sensor._int_period = start
+		sensor._update_timing()
+		sensor.reads = 0
+		def read_both_channels():
+			sensor.reads += 1
+			count = min(tsl2561.SIGNAL_SATURATED, int(light/sensor._scale))
+			return (count, min(tsl2561.SIGNAL_SATURATED, count//2))
+		sensor._read_both_channels = read_both_channels
+		return sensor
+
+	#---------------------------------------------------------------------------
+	# test_reads_are_bounded
+	#---------------------------------------------------------------------------
+	def test_reads_are_bounded(self):
+		# Saturated and very dark inputs need at most three reads from any starting setting
+		for light in (0, 0.5, 5, 1e7, 1e9):
+			for start in tsl2561.TIMING_STEPS:
+				sensor = self._sensor(light, start)
+				sensor.read_luminosity_opt()
+				self.assertLessEqual(sensor.reads, 3, 'light %s from %s took %i reads' % (light, start, sensor.reads))
+
+	#---------------------------------------------------------------------------
+	# test_extremes_end_at_the_limits
+	#---------------------------------------------------------------------------
+	def test_extremes_end_at_the_limits(self):
+		# Darkness ends on the most sensitive setting, and saturation on the least
+		dark = self._sensor(0, tsl2561.TIMING_STEPS[0])
+		dark.read_luminosity_opt()
+		self.assertEqual((dark._gain, dark._int_period), tsl2561.TIMING_STEPS[-1])
+		bright = self._sensor(1e9, tsl2561.TIMING_STEPS[-1])
+		bright.read_luminosity_opt()
+		self.assertEqual((bright._gain, bright._int_period), tsl2561.TIMING_STEPS[0])
+
+if __name__ == '__main__':
+	unittest.main()